@@ -0,0 +1,146 @@
+# bulk game analysis: streams games from a PGN file (plain or .gz), replays
+# them in worker processes and annotates every move with the static
+# evaluation, the search score and the bot's best move. results are written
+# as one JSON object per game as soon as they come back
+#
+#   python analyze.py games.pgn.gz --output analysis.jsonl --workers 8
+#   python analyze.py games.pgn --depth 3 --move-time 0.2 --max-games 1000
+#   python analyze.py games.pgn --depth 0          # static evaluation only
+#
+# each line looks like
+#   {"game": 1, "headers": {...}, "moves": [{"ply": 1, "move": "e4", "uci": "e2e4",
+#    "static": 0, "score": 35, "best": "d4"}, ...]}
+# with scores in centipawns from white's point of view. a game with an
+# illegal or unreadable move has an "error" and the moves up to it
+import argparse
+import itertools
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from main2 import ChessBoard, ImprovedChessBot, STARTING_FEN, evaluate_board
+from pgn import move_to_san, parse_san, read_games
+from uci import uci_move
+
+# games sent to a worker at a time
+BATCH_SIZE = 8
+# seconds between progress lines
+PROGRESS_INTERVAL = 5.0
+
+
+def describe(error):
+    return str(error) if isinstance(error, ValueError) else f"{type(error).__name__}: {error}"
+
+
+# annotations of one game, see the module comment. any error only fails this
+# game: it is recorded with the moves annotated before it
+def analyze_game(headers, sans, depth, move_time):
+    result = {'headers': headers, 'moves': []}
+    try:
+        board = ChessBoard.from_fen(headers.get('FEN', STARTING_FEN))
+        bot = ImprovedChessBot(board.turn, depth, move_time=move_time) if depth > 0 else None
+    except Exception as error:
+        result['error'] = describe(error)
+        return result
+
+    for ply, san in enumerate(sans, 1):
+        try:
+            move = parse_san(board, san)
+            annotation = {'ply': ply, 'move': san, 'uci': uci_move(board, move), 'static': evaluate_board(board)}
+            if bot is not None:
+                bot.color = board.turn
+                best = bot.choose_move(board)
+                annotation['score'] = bot.best_score
+                annotation['best'] = move_to_san(board, best)
+            board.make_move(*move)
+        except Exception as error:
+            result['error'] = f"{describe(error)} at ply {ply}"
+            break
+        result['moves'].append(annotation)
+    return result
+
+
+# worker task: a batch of (number, headers, sans)
+def analyze_batch(games, depth, move_time):
+    results = []
+    for number, headers, sans in games:
+        results.append({'game': number, **analyze_game(headers, sans, depth, move_time)})
+    return results
+
+
+def batches(games, size):
+    numbered = ((number, headers, sans) for number, (headers, sans) in enumerate(games, 1))
+    while True:
+        batch = list(itertools.islice(numbered, size))
+        if not batch:
+            return
+        yield batch
+
+
+def run(pgn_path, output, depth, move_time=None, workers=None, max_games=None, batch_size=BATCH_SIZE, log=sys.stderr):
+    games = read_games(pgn_path)
+    if max_games is not None:
+        games = itertools.islice(games, max_games)
+    queued = batches(games, batch_size)
+
+    start = last_report = time.perf_counter()
+    analyzed = errors = positions = 0
+
+    def progress():
+        elapsed = time.perf_counter() - start
+        print(f"{analyzed} games, {positions} positions, {errors} errors, "
+              f"{positions / elapsed:.0f} positions/s", file=log, flush=True)
+
+    with ProcessPoolExecutor(workers) as pool:
+        # only a few batches are read ahead, so memory stays flat on any file size
+        window = 2 * (workers or os.cpu_count() or 1)
+        pending = set()
+
+        def submit():
+            for batch in queued:
+                pending.add(pool.submit(analyze_batch, batch, depth, move_time))
+                if len(pending) >= window:
+                    break
+
+        submit()
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                pending.remove(future)
+                for result in future.result():
+                    output.write(json.dumps(result) + '\n')
+                    analyzed += 1
+                    errors += 'error' in result
+                    positions += len(result['moves'])
+            output.flush()
+            submit()
+            if time.perf_counter() - last_report >= PROGRESS_INTERVAL:
+                last_report = time.perf_counter()
+                progress()
+    progress()
+    return analyzed, positions, errors
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Annotate the moves of PGN games with evaluations and best moves")
+    parser.add_argument("pgn", help="PGN file, gzip compressed if it ends in .gz")
+    parser.add_argument("--output", help="JSON lines output (default: stdout)")
+    parser.add_argument("--depth", type=int, default=2, help="search depth per move, 0 for static evaluation only")
+    parser.add_argument("--move-time", type=float, help="seconds per move instead of a fixed depth")
+    parser.add_argument("--workers", type=int, default=None, help="analysis processes (default: CPU count)")
+    parser.add_argument("--max-games", type=int)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="games per worker task")
+    args = parser.parse_args(argv)
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            run(args.pgn, output, args.depth, args.move_time, args.workers, args.max_games, args.batch_size)
+    else:
+        run(args.pgn, sys.stdout, args.depth, args.move_time, args.workers, args.max_games, args.batch_size)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,109 @@
+# batch evaluation with numpy: scores many positions at once with the same
+# result as main2.evaluate_board, for offline analysis (needs numpy, the
+# engine itself doesn't)
+#
+# positions are either
+#   (N, 64) piece codes: 0 for an empty square, 1-6 white pawn, knight,
+#           bishop, rook, queen, king and 7-12 the black ones
+#   (N, 12, 64) piece planes: plane code - 1 is nonzero where that piece is
+# with squares numbered row * 8 + col (a1 = 0) like bitboard.py
+#
+#   codes = encode_boards(boards)
+#   scores = evaluate_batch(codes)
+#   scores = evaluate_batch(unpack_codes(open('positions.bin', 'rb').read()))
+import numpy as np
+
+from bitboard import PIECE_TYPES
+from main2 import PIECE_SQUARE_SCORES, PACKED_SIZE
+
+PLANE_KEYS = [(piece_type, color) for color in ['white', 'black'] for piece_type in PIECE_TYPES]
+WHITE_PAWN, WHITE_KNIGHT, WHITE_BISHOP = 1, 2, 3
+BLACK_PAWN, BLACK_KNIGHT, BLACK_BISHOP = 7, 8, 9
+
+# material + piece-square score of every code on every square, row 0 is empty
+CODE_SCORES = np.array([[0] * 64] + [PIECE_SQUARE_SCORES[key] for key in PLANE_KEYS], dtype=np.int64)
+SQUARE_INDEX = np.arange(64)
+
+# positions scored per step, bounds the temporary arrays
+CHUNK_SIZE = 1 << 16
+
+
+# (N, 64) piece codes of a list of ChessBoards
+def encode_boards(boards):
+    codes = np.zeros((len(boards), 64), dtype=np.int8)
+    for i, board in enumerate(boards):
+        for row in range(8):
+            for col in range(8):
+                piece = board.board[row][col]
+                if piece:
+                    codes[i, row * 8 + col] = piece.code
+    return codes
+
+
+# (N, 64) piece codes of N positions written with ChessBoard.pack one after
+# another; the nibble codes are the same as ours
+def unpack_codes(data):
+    packed = np.frombuffer(data, dtype=np.uint8)
+    if packed.size % PACKED_SIZE:
+        raise ValueError(f"data is not a whole number of {PACKED_SIZE} byte positions")
+    squares = packed.reshape(-1, PACKED_SIZE)[:, :32]
+    codes = np.empty((len(squares), 64), dtype=np.int8)
+    codes[:, 0::2] = squares & 15
+    codes[:, 1::2] = squares >> 4
+    return codes
+
+
+def planes_to_codes(planes):
+    occupied = planes != 0
+    if (occupied.sum(axis=1) > 1).any():
+        raise ValueError("more than one piece on a square")
+    return (occupied * np.arange(1, 13)[:, None]).sum(axis=1)
+
+
+# doubled and isolated pawn penalty (main2.pawn_structure_penalty) of one
+# side, from its (N, 8) pawn counts per file
+def pawn_structure_penalty(files):
+    padded = np.pad(files, ((0, 0), (1, 1)))
+    isolated = (files > 0) & (padded[:, :-2] == 0) & (padded[:, 2:] == 0)
+    return (files * (files - 1) * 50).sum(axis=1) + (files * 30 * isolated).sum(axis=1)
+
+
+def _evaluate_codes(codes):
+    n = len(codes)
+    score = CODE_SCORES[codes, SQUARE_INDEX].sum(axis=1)
+
+    # piece counts per code, one bincount over the whole chunk
+    counts = np.bincount((codes + 13 * np.arange(n)[:, None]).ravel(), minlength=13 * n).reshape(n, 13)
+
+    white_files = (codes == WHITE_PAWN).reshape(n, 8, 8).sum(axis=1, dtype=np.int64)
+    black_files = (codes == BLACK_PAWN).reshape(n, 8, 8).sum(axis=1, dtype=np.int64)
+    score += pawn_structure_penalty(black_files) - pawn_structure_penalty(white_files)
+
+    white_bishops = counts[:, WHITE_BISHOP]
+    black_bishops = counts[:, BLACK_BISHOP]
+    score += np.where(white_bishops >= 2, 50 * white_bishops, 0)
+    score -= np.where(black_bishops >= 2, 50 * black_bishops, 0)
+
+    pawn_count = counts[:, WHITE_PAWN] + counts[:, BLACK_PAWN]
+    score += (counts[:, WHITE_KNIGHT] - counts[:, BLACK_KNIGHT]) * pawn_count * 2
+    return score
+
+
+# evaluate_board scores (white's point of view) of N positions as an int64 array
+def evaluate_batch(positions, chunk_size=CHUNK_SIZE):
+    positions = np.asarray(positions)
+    if positions.ndim == 3 and positions.shape[1:] == (12, 64):
+        to_codes = planes_to_codes
+    elif positions.ndim == 2 and positions.shape[1] == 64:
+        if positions.size and (positions.min() < 0 or positions.max() > 12):
+            raise ValueError("piece codes must be between 0 and 12")
+        to_codes = None
+    else:
+        raise ValueError(f"expected an (N, 64) or (N, 12, 64) array, got shape {positions.shape}")
+
+    scores = np.empty(len(positions), dtype=np.int64)
+    for start in range(0, len(positions), chunk_size):
+        chunk = positions[start:start + chunk_size]
+        codes = to_codes(chunk) if to_codes else chunk
+        scores[start:start + chunk_size] = _evaluate_codes(codes.astype(np.intp))
+    return scores
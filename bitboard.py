@@ -0,0 +1,253 @@
+# bitboard backend for the ChessBoard interface in main2.py
+#
+# squares are numbered row * 8 + col (a1 = 0, h8 = 63) so they map directly
+# onto the (row, col) coordinates used everywhere else. the mailbox grid in
+# self.board is kept as well, the evaluation and printing still read it.
+from main2 import ChessBoard, Pawn, Knight, Bishop, Rook, Queen, King, play_chess_with_improved_ai
+
+FULL = (1 << 64) - 1
+FILE_A = 0x0101010101010101
+FILE_H = FILE_A << 7
+RANK_3 = 0xFF << 16
+RANK_6 = 0xFF << 40
+
+WHITE, BLACK = 0, 1
+COLOR_INDEX = {'white': WHITE, 'black': BLACK}
+
+# bitboard index of a piece is color * 6 + type index, which is piece.code - 1
+PIECE_TYPES = [Pawn, Knight, Bishop, Rook, Queen, King]
+
+SQUARES = [divmod(square, 8) for square in range(64)]
+
+
+def _step_attacks(offsets):
+    table = []
+    for square in range(64):
+        row, col = divmod(square, 8)
+        mask = 0
+        for dr, dc in offsets:
+            r, c = row + dr, col + dc
+            if 0 <= r < 8 and 0 <= c < 8:
+                mask |= 1 << (r * 8 + c)
+        table.append(mask)
+    return table
+
+
+def _ray_table(dr, dc):
+    table = []
+    for square in range(64):
+        row, col = divmod(square, 8)
+        mask = 0
+        r, c = row + dr, col + dc
+        while 0 <= r < 8 and 0 <= c < 8:
+            mask |= 1 << (r * 8 + c)
+            r, c = r + dr, c + dc
+        table.append(mask)
+    return table
+
+
+KNIGHT_ATTACKS = _step_attacks([
+    (-2, -1), (-2, 1), (-1, -2), (-1, 2),
+    (1, -2), (1, 2), (2, -1), (2, 1)
+])
+KING_ATTACKS = _step_attacks([
+    (1, 0), (-1, 0), (0, 1), (0, -1),
+    (1, 1), (1, -1), (-1, 1), (-1, -1)
+])
+# squares attacked by a pawn of each color standing on a square
+PAWN_ATTACKS = [_step_attacks([(1, -1), (1, 1)]), _step_attacks([(-1, -1), (-1, 1)])]
+
+# (ray table, True if the ray runs towards higher square numbers)
+ROOK_RAYS = [(_ray_table(dr, dc), dr * 8 + dc > 0) for dr, dc in [(1, 0), (0, 1), (-1, 0), (0, -1)]]
+BISHOP_RAYS = [(_ray_table(dr, dc), dr * 8 + dc > 0) for dr, dc in [(1, 1), (1, -1), (-1, 1), (-1, -1)]]
+
+
+# sliding attacks: each ray is cut off behind the first blocker, which is the
+# lowest set bit for rays going up the board and the highest one going down
+def _slide(square, occupied, rays):
+    attacks = 0
+    for table, positive in rays:
+        ray = table[square]
+        blockers = ray & occupied
+        if blockers:
+            if positive:
+                blocker = (blockers & -blockers).bit_length() - 1
+            else:
+                blocker = blockers.bit_length() - 1
+            ray ^= table[blocker]
+        attacks |= ray
+    return attacks
+
+
+def rook_attacks(square, occupied):
+    return _slide(square, occupied, ROOK_RAYS)
+
+
+def bishop_attacks(square, occupied):
+    return _slide(square, occupied, BISHOP_RAYS)
+
+
+def queen_attacks(square, occupied):
+    return _slide(square, occupied, ROOK_RAYS) | _slide(square, occupied, BISHOP_RAYS)
+
+
+def squares_of(bitboard):
+    while bitboard:
+        low = bitboard & -bitboard
+        yield low.bit_length() - 1
+        bitboard ^= low
+
+
+class BitboardChessBoard(ChessBoard):
+    def recompute_state(self):
+        super().recompute_state()
+        self.sync_bitboards()
+
+    # rebuilds the 12 piece bitboards and occupancy masks from the grid
+    def sync_bitboards(self):
+        self.bitboards = [0] * 12
+        for row in range(8):
+            for col in range(8):
+                piece = self.board[row][col]
+                if piece:
+                    self.bitboards[piece.code - 1] |= 1 << (row * 8 + col)
+        bbs = self.bitboards
+        self.occupancy = [
+            bbs[0] | bbs[1] | bbs[2] | bbs[3] | bbs[4] | bbs[5],
+            bbs[6] | bbs[7] | bbs[8] | bbs[9] | bbs[10] | bbs[11]
+        ]
+        self.occupied = self.occupancy[WHITE] | self.occupancy[BLACK]
+
+    # every bitboard change of a move is an xor, so applying the same undo
+    # record a second time takes the move back
+    def _toggle(self, record):
+        if record[0] is None:
+            return # null move, no piece moved
+        start, end, piece, captured, captured_square, _, promoted, castling_rook = record[:8]
+        bbs = self.bitboards
+        occupancy = self.occupancy
+        side = piece.side
+        from_bit = 1 << (start[0] * 8 + start[1])
+        to_bit = 1 << (end[0] * 8 + end[1])
+
+        bbs[piece.code - 1] ^= from_bit
+        bbs[(promoted or piece).code - 1] ^= to_bit
+        occupancy[side] ^= from_bit | to_bit
+
+        if captured is not None:
+            bit = 1 << (captured_square[0] * 8 + captured_square[1])
+            bbs[captured.code - 1] ^= bit
+            occupancy[side ^ 1] ^= bit
+
+        if castling_rook:
+            rook_from, rook_to = castling_rook
+            bits = (1 << (start[0] * 8 + rook_from)) | (1 << (start[0] * 8 + rook_to))
+            bbs[side * 6 + 3] ^= bits
+            occupancy[side] ^= bits
+
+        self.occupied = occupancy[WHITE] | occupancy[BLACK]
+
+    def make_move(self, start, end, promotion=None):
+        super().make_move(start, end, promotion)
+        self._toggle(self.history[-1])
+
+    def unmake_move(self):
+        self._toggle(self.history[-1])
+        super().unmake_move()
+
+    # true if any piece of by_side attacks the square (0-63), sliders see
+    # through the ignore square
+    def attacked_by(self, square, by_side, ignore=None):
+        bbs = self.bitboards
+        occupied = self.occupied
+        if ignore is not None:
+            occupied &= ~(1 << ignore)
+        base = by_side * 6
+        if KNIGHT_ATTACKS[square] & bbs[base + 1]:
+            return True
+        if KING_ATTACKS[square] & bbs[base + 5]:
+            return True
+        # a pawn attacks the square if a pawn of the other color there would attack it
+        if PAWN_ATTACKS[by_side ^ 1][square] & bbs[base]:
+            return True
+        queens = bbs[base + 4]
+        if rook_attacks(square, occupied) & (bbs[base + 3] | queens):
+            return True
+        if bishop_attacks(square, occupied) & (bbs[base + 2] | queens):
+            return True
+        return False
+
+    def is_in_check(self, color, board=None):
+        # a separate grid can only be checked the slow way
+        if board is not None:
+            return super().is_in_check(color, board)
+
+        side = COLOR_INDEX[color]
+        king = self.bitboards[side * 6 + 5]
+        if not king:
+            return False
+        return self.attacked_by(king.bit_length() - 1, side ^ 1)
+
+    def is_square_attacked(self, row, col, by_color, ignore=None):
+        if ignore is not None:
+            ignore = ignore[0] * 8 + ignore[1]
+        return self.attacked_by(row * 8 + col, COLOR_INDEX[by_color], ignore)
+
+    # same move set as the mailbox version (pieces' valid_moves), generated
+    # from the attack tables
+    def pseudo_legal_moves(self, color):
+        side = COLOR_INDEX[color]
+        bbs = self.bitboards
+        base = side * 6
+        own = self.occupancy[side]
+        enemy = self.occupancy[side ^ 1]
+        occupied = self.occupied
+        empty = ~occupied & FULL
+        moves = []
+
+        # pawns are generated set-wise, the origin is recovered from the shift
+        pawns = bbs[base]
+        if side == WHITE:
+            single = (pawns << 8) & empty
+            double = ((single & RANK_3) << 8) & empty
+            pawn_targets = [
+                (single, -8),
+                (double, -16),
+                ((pawns << 7) & ~FILE_H & enemy, -7),
+                ((pawns << 9) & ~FILE_A & enemy, -9)
+            ]
+        else:
+            single = (pawns >> 8) & empty
+            double = ((single & RANK_6) >> 8) & empty
+            pawn_targets = [
+                (single, 8),
+                (double, 16),
+                ((pawns >> 9) & ~FILE_H & enemy, 9),
+                ((pawns >> 7) & ~FILE_A & enemy, 7)
+            ]
+        for targets, offset in pawn_targets:
+            for to_square in squares_of(targets):
+                moves.append((SQUARES[to_square + offset], SQUARES[to_square]))
+
+        not_own = ~own & FULL
+        for from_square in squares_of(bbs[base + 1]):
+            for to_square in squares_of(KNIGHT_ATTACKS[from_square] & not_own):
+                moves.append((SQUARES[from_square], SQUARES[to_square]))
+        for from_square in squares_of(bbs[base + 2]):
+            for to_square in squares_of(bishop_attacks(from_square, occupied) & not_own):
+                moves.append((SQUARES[from_square], SQUARES[to_square]))
+        for from_square in squares_of(bbs[base + 3]):
+            for to_square in squares_of(rook_attacks(from_square, occupied) & not_own):
+                moves.append((SQUARES[from_square], SQUARES[to_square]))
+        for from_square in squares_of(bbs[base + 4]):
+            for to_square in squares_of(queen_attacks(from_square, occupied) & not_own):
+                moves.append((SQUARES[from_square], SQUARES[to_square]))
+        for from_square in squares_of(bbs[base + 5]):
+            for to_square in squares_of(KING_ATTACKS[from_square] & not_own):
+                moves.append((SQUARES[from_square], SQUARES[to_square]))
+
+        return moves
+
+
+if __name__ == "__main__":
+    play_chess_with_improved_ai(BitboardChessBoard)
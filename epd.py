@@ -0,0 +1,263 @@
+# tactical test suite runner: searches EPD positions under a fixed node or
+# time budget and checks the bot's move against the position's bm (best move)
+# and am (avoid move) operations. reports the solve rate and, for every
+# solved position, the time and nodes at which the solution was found and
+# then kept, and compares the run against a saved baseline
+#
+#   python epd.py                                   # bundled suite, improved bot
+#   python epd.py tactics.epd --nodes 200000
+#   python epd.py --player "basic:depth=4" --nodes 50000
+#   python epd.py --player "improved:lmr=false" --time 1
+#   python epd.py --save-baseline epd_baseline.json
+#   python epd.py --baseline epd_baseline.json      # exit status 1 on regressions
+#
+# players are written like in tournament.py. the improved bot deepens until
+# the budget runs out; the basic bot is searched at depth 1, 2, ... up to its
+# depth option for as long as the next depth is expected to fit the budget
+import argparse
+import json
+import re
+import sys
+import time
+
+from main2 import ChessBoard, ImprovedChessBot
+from pgn import move_to_san, parse_san
+from tournament import PLAYER_CLASSES, parse_player
+
+DEFAULT_NODES = 20000
+
+# bundled suite: positions from the Win At Chess collection and a few
+# simple mates and blunder checks, so the runner works offline
+BUNDLED_SUITE = '''
+2rr3k/pp3pp1/1nnqbN1p/3pN3/2pP4/2P3Q1/PPB4P/R4RK1 w - - bm Qg6; id "WAC.001";
+8/7p/5k2/5p2/p1p2P2/Pr1pPK2/1P1R3P/8 b - - bm Rxb2; id "WAC.002";
+5rk1/1ppb3p/p1pb4/6q1/3P1p1r/2P1R2P/PP1BQ1P1/5RKN w - - bm Rg3; id "WAC.003";
+r1bq2rk/pp3pbp/2p1p1pQ/7P/3P4/2PB1N2/PP3PPR/2KR4 w - - bm Qxh7+; id "WAC.004";
+5k2/6pp/p1qN4/1p1p4/3P4/2PKP2Q/PP3r2/3R4 b - - bm Qc4+; id "WAC.005";
+7k/p7/1R5K/6r1/6p1/6P1/8/8 w - - bm Rb7; id "WAC.006";
+rnbqkb1r/pppp1ppp/8/4P3/6n1/7P/PPPNPPP1/R1BQKBNR b KQkq - bm Ne3; id "WAC.007";
+r4q1k/p2bR1rp/2p2Q1N/5p2/5p2/2P5/PP3PPP/R5K1 w - - bm Rf7; id "WAC.008";
+3q1rk1/p4pp1/2pb3p/3p4/6Pr/1PNQ4/P1PB1PP1/4RRK1 b - - bm Bh2+; id "WAC.009";
+2br2k1/2q3rn/p2NppQ1/2p1P3/Pp5R/4P3/1P3PPP/3R2K1 w - - bm Rxh7; id "WAC.010";
+r1b1kb1r/3q1ppp/pBp1pn2/8/Np3P2/5B2/PPP3PP/R2Q1RK1 w kq - bm Bxc6; id "WAC.011";
+4k1r1/2p3r1/1pR1p3/3pP2p/3P2qP/P4N2/1PQ4P/5R1K b - - bm Qxf3+; id "WAC.012";
+5rk1/pp4p1/2n1p2p/2Npq3/2p5/6P1/P3P1BP/R4Q1K w - - bm Qxf8+; id "WAC.013";
+r2rb1k1/pp1q1p1p/2n1p1p1/2bp4/5P2/PP1BPR1Q/1BPN2PP/R5K1 w - - bm Qxh7+; id "WAC.014";
+1R6/1brk2p1/4p2p/p1P1Pp2/P7/6P1/1P4P1/2R3K1 w - - bm Rxb7; id "WAC.015";
+r4rk1/ppp2ppp/2n5/2bqp3/8/P2PB3/1PP1NPPP/R2Q1RK1 w - - bm Nc3; id "WAC.016";
+R7/P4k2/8/8/8/8/r7/6K1 w - - bm Rh8; id "WAC.018";
+r1b2rk1/ppbn1ppp/4p3/1QP4q/3P4/N4N2/5PPP/R1B2RK1 w - - bm c6; id "WAC.019";
+r2qkb1r/1ppb1ppp/p7/4p3/P1Q1P3/2P5/5PPP/R1B2KNR b kq - bm Bb5; id "WAC.020";
+5rk1/1b3p1p/pp3p2/3n1N2/1P6/P1qB1PP1/3Q3P/4R1K1 w - - bm Qh6; id "WAC.021";
+r1bqk2r/ppp1nppp/4p3/n5N1/2BPp3/P1P5/2P2PPP/R1BQK2R w KQkq - bm Ba2 Nxf7; id "WAC.022";
+r3nrk1/2p2p1p/p1p1b1p1/2NpPq2/3R4/P1N1Q3/1PP2PPP/4R1K1 w - - bm g4; id "WAC.023";
+6k1/1b1nqpbp/pp4p1/5P2/1PN5/4Q3/P5PP/1B2B1K1 b - - bm Bd4; id "WAC.024";
+3R1rk1/8/5Qpp/2p5/2P1p1q1/P3P3/1P2PK2/8 b - - bm Qh4+; id "WAC.025";
+3r2k1/1p1b1pp1/pq5p/8/3NR3/2PQ3P/PP3PP1/6K1 b - - bm Bf5; id "WAC.026";
+7k/pp4np/2p3p1/3pN1q1/3P4/Q7/1r3rPP/2R2RK1 w - - bm Qf8+; id "WAC.027";
+1r1r2k1/4pp1p/2p1b1p1/p3R3/RqBP4/4P3/1PQ2PPP/6K1 b - - bm Qe1+; id "WAC.028";
+r2q2k1/pp1rbppp/4pn2/2P5/1P3B2/6P1/P3QPBP/1R3RK1 w - - bm c6; id "WAC.029";
+1r3r2/4q1kp/b1pp2p1/5p2/pPn1N3/6P1/P3PPBP/2QRR1K1 w - - bm Nxd6; id "WAC.030";
+6k1/6p1/p7/3Pn3/5p2/4rBqP/P4RP1/5QK1 b - - bm Re1; id "WAC.032";
+6k1/5ppp/8/8/8/8/5PPP/3R2K1 w - - bm Rd8#; id "mate.001";
+r1bqkbnr/pppp1ppp/2n5/4p3/2B1P3/5Q2/PPPP1PPP/RNB1K1NR w KQkq - bm Qxf7#; id "mate.002";
+r1bqkbnr/pppp1ppp/2n5/4p3/4P3/5N2/PPPP1PPP/RNBQKB1R w KQkq - am Nxe5; id "avoid.001";
+'''
+
+OPERATION_PATTERN = re.compile(r'\s*(\w+)((?:\s+(?:"[^"]*"|[^;\s]+))*)\s*;')
+OPERAND_PATTERN = re.compile(r'"([^"]*)"|([^;\s]+)')
+
+
+# (fen, {opcode: [operands]}) of one EPD line; the move counters default to "0 1"
+def parse_epd(line):
+    fields = line.split(None, 4)
+    if len(fields) < 4:
+        raise ValueError(f"invalid EPD: {line.strip()!r}")
+    fen = ' '.join(fields[:4]) + ' 0 1'
+    operations = {}
+    rest = fields[4] if len(fields) > 4 else ''
+    position = 0
+    while rest[position:].strip():
+        match = OPERATION_PATTERN.match(rest, position)
+        if not match:
+            raise ValueError(f"invalid EPD operations: {rest[position:].strip()!r}")
+        operations[match.group(1)] = [quoted or plain for quoted, plain in OPERAND_PATTERN.findall(match.group(2))]
+        position = match.end()
+    return fen, operations
+
+
+# (id, fen, best moves, avoided moves) of every position in EPD lines, with
+# the moves resolved against the position. a position needs a bm or an am
+def load_suite(lines):
+    suite = []
+    for number, line in enumerate(lines, 1):
+        if not line.strip() or line.startswith('#'):
+            continue
+        try:
+            fen, operations = parse_epd(line)
+            board = ChessBoard.from_fen(fen)
+            best = [parse_san(board, san) for san in operations.get('bm', [])]
+            avoid = [parse_san(board, san) for san in operations.get('am', [])]
+        except ValueError as error:
+            raise ValueError(f"line {number}: {error}") from None
+        if not best and not avoid:
+            raise ValueError(f"line {number}: no bm or am operation")
+        name = operations.get('id', [f"line {number}"])[0]
+        suite.append((name, fen, best, avoid))
+    return suite
+
+
+def is_solution(move, best, avoid):
+    return move is not None and (not best or move in best) and move not in avoid
+
+
+# searches one position; returns the move and the (depth, move, seconds,
+# nodes) of every finished depth, seconds and nodes counted from the start
+def search(player, fen, nodes=None, seconds=None):
+    kind, options = parse_player(player)
+    board = ChessBoard.from_fen(fen)
+    iterations = []
+    start = time.perf_counter()
+
+    if PLAYER_CLASSES[kind] is ImprovedChessBot:
+        if nodes is not None or seconds is not None:
+            options.update(node_limit=nodes, move_time=seconds)
+        bot = ImprovedChessBot(board.turn, **options)
+        bot.on_iteration = lambda bot, board, depth, move, score: iterations.append(
+            (depth, move, time.perf_counter() - start, bot.context.nodes))
+        move = bot.choose_move(board)
+        bot.close()
+        return move, iterations
+
+    # the basic bot has no iterative deepening of its own
+    max_depth = options.pop('depth')
+    bot = PLAYER_CLASSES[kind](board.turn, 1, stats=True, **options)
+    move = None
+    total = previous = 0
+    for depth in range(1, max_depth + 1):
+        bot.depth = depth
+        move = bot.choose_move(board)
+        if move is None:
+            break
+        total += bot.stats.nodes
+        iterations.append((depth, move, time.perf_counter() - start, total))
+        # expect the next depth to grow by as much as this one did
+        growth = bot.stats.nodes / previous if previous else bot.stats.nodes
+        previous = bot.stats.nodes
+        if nodes is not None and total + previous * growth > nodes:
+            break
+        if seconds is not None and (time.perf_counter() - start) * (1 + growth) > seconds:
+            break
+    bot.close()
+    return move, iterations
+
+
+# result of one position: whether the final move solves it, and the depth,
+# time and nodes of the first iteration from which every move was a solution
+def run_position(player, name, fen, best, avoid, nodes=None, seconds=None):
+    move, iterations = search(player, fen, nodes, seconds)
+    board = ChessBoard.from_fen(fen)
+    result = {'id': name, 'move': move_to_san(board, move) if move else None,
+              'solved': is_solution(move, best, avoid), 'depth': None, 'time': None, 'nodes': None,
+              'total_nodes': iterations[-1][3] if iterations else 0}
+    if result['solved']:
+        found = len(iterations)
+        while found > 0 and is_solution(iterations[found - 1][1], best, avoid):
+            found -= 1
+        if found < len(iterations):
+            depth, _, seconds_taken, nodes_taken = iterations[found]
+            result.update(depth=depth, time=round(seconds_taken, 4), nodes=nodes_taken)
+    return result
+
+
+def expected_text(fen, best, avoid):
+    board = ChessBoard.from_fen(fen)
+    parts = []
+    if best:
+        parts.append('bm ' + ' '.join(move_to_san(board, move) for move in best))
+    if avoid:
+        parts.append('am ' + ' '.join(move_to_san(board, move) for move in avoid))
+    return ', '.join(parts)
+
+
+def summary(results):
+    solved = [result for result in results if result['solved']]
+    line = f"solved {len(solved)}/{len(results)}"
+    timed = [result for result in solved if result['nodes'] is not None]
+    if timed:
+        line += (f", to solution: {sum(r['nodes'] for r in timed)} nodes, "
+                 f"{sum(r['time'] for r in timed):.2f}s, mean depth "
+                 f"{sum(r['depth'] for r in timed) / len(timed):.1f}")
+    return line
+
+
+# positions solved in the baseline and not now (regressions), the reverse
+# (fixes), and the nodes to solution of the positions solved in both
+def compare(results, baseline):
+    before = baseline['results']
+    regressions = [r['id'] for r in results if r['id'] in before and before[r['id']]['solved'] and not r['solved']]
+    fixes = [r['id'] for r in results if r['id'] in before and not before[r['id']]['solved'] and r['solved']]
+    both = [(before[r['id']]['nodes'], r['nodes']) for r in results
+            if r['solved'] and r['id'] in before and before[r['id']]['solved']
+            and r['nodes'] is not None and before[r['id']]['nodes'] is not None]
+    return regressions, fixes, both
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a tactical EPD test suite")
+    parser.add_argument("epd", nargs="?", help="EPD file (default: the bundled suite)")
+    parser.add_argument("--player", default="improved", help='bot, e.g. "improved:lmr=false" or "basic:depth=4"')
+    parser.add_argument("--nodes", type=int, help=f"node budget per position (default: {DEFAULT_NODES})")
+    parser.add_argument("--time", type=float, help="seconds per position instead of a node budget")
+    parser.add_argument("--baseline", help="compare against a baseline saved with --save-baseline")
+    parser.add_argument("--save-baseline", help="write the results as a baseline file")
+    args = parser.parse_args(argv)
+
+    try:
+        parse_player(args.player)
+        if args.epd:
+            with open(args.epd) as f:
+                suite = load_suite(f)
+        else:
+            suite = load_suite(BUNDLED_SUITE.splitlines())
+    except (OSError, ValueError) as error:
+        parser.error(str(error))
+    nodes = args.nodes if args.nodes is not None or args.time is not None else DEFAULT_NODES
+
+    results = []
+    for name, fen, best, avoid in suite:
+        result = run_position(args.player, name, fen, best, avoid, nodes, args.time)
+        results.append(result)
+        found = (f"depth {result['depth']:2} {result['nodes']:>9} nodes {result['time']:7.2f}s"
+                 if result['nodes'] is not None else '')
+        print(f"{name:12} {'ok' if result['solved'] else '--'} {result['move'] or '-':8} "
+              f"({expected_text(fen, best, avoid)}) {found}", flush=True)
+    print(summary(results))
+
+    status = 0
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if (baseline.get('player'), baseline.get('nodes'), baseline.get('time')) != (args.player, nodes, args.time):
+            print(f"note: baseline was run with {baseline.get('player')}, "
+                  f"nodes {baseline.get('nodes')}, time {baseline.get('time')}")
+        regressions, fixes, both = compare(results, baseline)
+        print(f"baseline: {summary(list(baseline['results'].values()))}")
+        if both:
+            before = sum(old for old, _ in both)
+            after = sum(new for _, new in both)
+            print(f"nodes to solution on {len(both)} positions solved by both: {before} -> {after} "
+                  f"({after / before if before else 0:.2f}x)")
+        print(f"fixed: {', '.join(fixes) or 'none'}")
+        print(f"regressions: {', '.join(regressions) or 'none'}")
+        status = 1 if regressions else 0
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump({'player': args.player, 'nodes': nodes, 'time': args.time,
+                       'results': {result['id']: result for result in results}}, f, indent=1)
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
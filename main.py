@@ -1,5 +1,3 @@
-import copy
-
 class ChessPiece: # parent class for chess pieces
     def __init__(self, color):
         self.color = color
@@ -151,6 +149,7 @@ class ChessBoard:
         self.board = [[None for _ in range(8)] for _ in range(8)] #initialize the board
         self.initialize_board()
         self.en_passant_target = None
+        self.history = [] # undo records pushed by make_move
 
     def initialize_board(self):
         # Set up  the pawns
@@ -188,45 +187,82 @@ class ChessBoard:
         if (end_row, end_col) not in piece.valid_moves(self.board, start_row, start_col):
             return False
 
-        # Check if the move puts the player in check
-        temp_board = copy.deepcopy(self.board)
-        temp_board[end_row][end_col] = piece
-        temp_board[start_row][start_col] = None
-        if self.is_in_check(piece.color, temp_board):
+        # play the move and take it back if it leaves the player in check
+        self.make_move(start, end)
+        if self.is_in_check(piece.color):
+            self.unmake_move()
             return False
 
-        # Move the piece
-        self.board[end_row][end_col] = piece
-        self.board[start_row][start_col] = None
+        return True
+
+    # plays a move without validating it and pushes an undo record so that
+    # unmake_move can restore the exact previous position (used by the search
+    # instead of deep-copying the board for every node)
+    def make_move(self, start, end, promotion=None):
+        start_row, start_col = start
+        end_row, end_col = end
+        board = self.board
+
+        piece = board[start_row][start_col]
+        captured = board[end_row][end_col]
+        captured_square = end
+        previous_target = self.en_passant_target
+        piece_had_moved = piece.has_moved
+        promoted = None
+        castling_rook = None
+
+        # en passant: a pawn moving diagonally onto the empty target square
+        if isinstance(piece, Pawn) and end == previous_target and captured is None and start_col != end_col:
+            captured_square = (start_row, end_col)
+            captured = board[start_row][end_col]
+            board[start_row][end_col] = None
+
+        board[end_row][end_col] = piece
+        board[start_row][start_col] = None
         piece.has_moved = True
 
         # pawn promotion at the last rank
         if isinstance(piece, Pawn) and (end_row == 0 or end_row == 7):
-            self.board[end_row][end_col] = Queen(piece.color)
+            promoted = (promotion or Queen)(piece.color)
+            board[end_row][end_col] = promoted
 
-        #en passant
+        # en passant target is only available right after a two-step move
         if isinstance(piece, Pawn) and abs(start_row - end_row) == 2:
             self.en_passant_target = ((start_row + end_row) // 2, start_col)
-        elif self.en_passant_target:
-            if isinstance(piece, Pawn) and end == self.en_passant_target:
-                self.board[start_row][end_col] = None  # Remove the captured pawn
         else:
             self.en_passant_target = None
 
         # castling
         if isinstance(piece, King) and abs(start_col - end_col) == 2:
-            if end_col > start_col:  # Kingside
-                rook = self.board[start_row][7]
-                self.board[start_row][5] = rook
-                self.board[start_row][7] = None
-                rook.has_moved = True
-            else:  # Queenside
-                rook = self.board[start_row][0]
-                self.board[start_row][3] = rook
-                self.board[start_row][0] = None
-                rook.has_moved = True
-
-        return True
+            rook_from, rook_to = (7, 5) if end_col > start_col else (0, 3)
+            rook = board[start_row][rook_from]
+            castling_rook = (rook, rook.has_moved, rook_from, rook_to)
+            board[start_row][rook_to] = rook
+            board[start_row][rook_from] = None
+            rook.has_moved = True
+
+        self.history.append((start, end, piece, piece_had_moved, captured, captured_square,
+                             previous_target, promoted, castling_rook))
+
+    # takes back the last move played with make_move
+    def unmake_move(self):
+        (start, end, piece, piece_had_moved, captured, captured_square,
+         previous_target, promoted, castling_rook) = self.history.pop()
+        board = self.board
+
+        if castling_rook:
+            rook, rook_had_moved, rook_from, rook_to = castling_rook
+            board[start[0]][rook_from] = rook
+            board[start[0]][rook_to] = None
+            rook.has_moved = rook_had_moved
+
+        board[end[0]][end[1]] = None
+        board[start[0]][start[1]] = piece
+        piece.has_moved = piece_had_moved
+        if captured is not None:
+            board[captured_square[0]][captured_square[1]] = captured
+
+        self.en_passant_target = previous_target
 
     def is_in_check(self, color, board=None):
         if board is None:
@@ -253,39 +289,30 @@ class ChessBoard:
                         return True
         return False
 
+    # true if any move of the given color doesn't leave its own king in check
+    def has_legal_move(self, color):
+        for piece, (row, col) in self.get_all_pieces(color):
+            for move in piece.valid_moves(self.board, row, col):
+                self.make_move((row, col), move)
+                in_check = self.is_in_check(color)
+                self.unmake_move()
+                if not in_check:
+                    return True
+        return False
+
     def is_checkmate(self, color):
         if not self.is_in_check(color):
             return False
 
         # check valid moves for the king to get out of the chekc
-        for row in range(8):
-            for col in range(8):
-                piece = self.board[row][col]
-                if piece and piece.color == color:
-                    for move in piece.valid_moves(self.board, row, col):
-                        temp_board = copy.deepcopy(self.board)
-                        temp_board[move[0]][move[1]] = piece
-                        temp_board[row][col] = None
-                        if not self.is_in_check(color, temp_board):
-                            return False
-        return True
+        return not self.has_legal_move(color)
 
     def is_stalemate(self, color):
         if self.is_in_check(color):
             return False
 
         # Check if any legal move is available
-        for row in range(8):
-            for col in range(8):
-                piece = self.board[row][col]
-                if piece and piece.color == color:
-                    for move in piece.valid_moves(self.board, row, col):
-                        temp_board = copy.deepcopy(self.board)
-                        temp_board[move[0]][move[1]] = piece
-                        temp_board[row][col] = None
-                        if not self.is_in_check(color, temp_board):
-                            return False
-        return True
+        return not self.has_legal_move(color)
 
     def get_all_pieces(self, color):
         pieces = []
@@ -322,19 +349,21 @@ def minimax(board, depth, maximizing_player):
         max_eval = float('-inf')
         for piece, (row, col) in board.get_all_pieces('white'):
             for move in piece.valid_moves(board.board, row, col):
-                new_board = copy.deepcopy(board)
-                if new_board.move_piece((row, col), move):
-                    evaluation = minimax(new_board, depth - 1, False)
+                board.make_move((row, col), move)
+                if not board.is_in_check('white'):
+                    evaluation = minimax(board, depth - 1, False)
                     max_eval = max(max_eval, evaluation)
+                board.unmake_move()
         return max_eval
     else:
         min_eval = float('inf')
         for piece, (row, col) in board.get_all_pieces('black'):
             for move in piece.valid_moves(board.board, row, col):
-                new_board = copy.deepcopy(board)
-                if new_board.move_piece((row, col), move):
-                    evaluation = minimax(new_board, depth - 1, True)
+                board.make_move((row, col), move)
+                if not board.is_in_check('black'):
+                    evaluation = minimax(board, depth - 1, True)
                     min_eval = min(min_eval, evaluation)
+                board.unmake_move()
         return min_eval
 
 
@@ -350,12 +379,13 @@ class ChessBot:
         
         for piece, (row, col) in board.get_all_pieces(self.color):
             for move in piece.valid_moves(board.board, row, col):
-                new_board = copy.deepcopy(board)
-                if new_board.move_piece((row, col), move):
-                    score = minimax(new_board, self.depth - 1, self.color == 'black')
+                board.make_move((row, col), move)
+                if not board.is_in_check(self.color):
+                    score = minimax(board, self.depth - 1, self.color == 'black')
                     if (self.color == 'white' and score > best_score) or (self.color == 'black' and score < best_score):
                         best_score = score
                         best_move = ((row, col), move)
+                board.unmake_move()
         return best_move
 
 # P v P game loop
@@ -1,4 +1,7 @@
-import copy
+import json
+import random
+import struct
+import time
 
 # piece-wise board points
 PAWN_TABLE = [
@@ -67,13 +70,49 @@ KING_TABLE = [
     [ 20, 30, 10,  0,  0, 10, 30, 20]
 ]
 
+COLORS = ('white', 'black')
+
 class ChessPiece: # parent class for chess pieces
-    def __init__(self, color):
-        self.color = color
-        self.has_moved = False # used for castling/pawns' initial moves etc.
+    # pieces are immutable and shared: Pawn('white') always returns the same
+    # instance, so a board is 64 references and moving a piece copies nothing.
+    # side is 0 for white and 1 for black, code is the piece code 1-12
+    # (white pawn, knight, bishop, rook, queen, king, then the black ones)
+    __slots__ = ('color', 'side', 'code')
+    kind = None # 0-5 in the order pawn, knight, bishop, rook, queen, king
+    _instances = {}
+
+    def __new__(cls, color):
+        piece = ChessPiece._instances.get((cls, color))
+        if piece is None:
+            if cls.kind is None:
+                raise TypeError("ChessPiece can't be created itself, only Pawn, Knight, Bishop, Rook, Queen or King")
+            if color not in COLORS:
+                raise ValueError(f"invalid color: {color!r}")
+            piece = object.__new__(cls)
+            side = COLORS.index(color)
+            object.__setattr__(piece, 'color', color)
+            object.__setattr__(piece, 'side', side)
+            object.__setattr__(piece, 'code', 1 + cls.kind + 6 * side)
+            ChessPiece._instances[cls, color] = piece
+        return piece
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} pieces are shared and can't be changed")
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        return type(self), (self.color,)
 
 # all the child piece classes of the ChessPiece parent class
 class Pawn(ChessPiece):
+    __slots__ = ()
+    kind = 0
+
     def __str__(self):
         return 'P' if self.color == 'white' else 'p'
 
@@ -99,6 +138,9 @@ class Pawn(ChessPiece):
         return moves
 
 class Rook(ChessPiece):
+    __slots__ = ()
+    kind = 3
+
     def __str__(self):
         return 'R' if self.color == 'white' else 'r'
 
@@ -124,6 +166,9 @@ class Rook(ChessPiece):
         return moves
 
 class Knight(ChessPiece):
+    __slots__ = ()
+    kind = 1
+
     def __str__(self):
         return 'N' if self.color == 'white' else 'n'
 
@@ -144,6 +189,9 @@ class Knight(ChessPiece):
         return moves
 
 class Bishop(ChessPiece):
+    __slots__ = ()
+    kind = 2
+
     def __str__(self):
         return 'B' if self.color == 'white' else 'b'
 
@@ -168,6 +216,9 @@ class Bishop(ChessPiece):
         return moves
 
 class Queen(ChessPiece):
+    __slots__ = ()
+    kind = 4
+
     def __str__(self):
         return 'Q' if self.color == 'white' else 'q'
 
@@ -195,6 +246,9 @@ class Queen(ChessPiece):
         return moves
 
 class King(ChessPiece):
+    __slots__ = ()
+    kind = 5
+
     def __str__(self):
         return 'K' if self.color == 'white' else 'k'
 
@@ -213,11 +267,250 @@ class King(ChessPiece):
         
         return moves
 
+KNIGHT_OFFSETS = [(-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1)]
+KING_OFFSETS = [(1, 0), (-1, 0), (0, 1), (0, -1), (1, 1), (1, -1), (-1, 1), (-1, -1)]
+ROOK_DIRECTIONS = [(1, 0), (-1, 0), (0, 1), (0, -1)]
+BISHOP_DIRECTIONS = [(1, 1), (1, -1), (-1, 1), (-1, -1)]
+
+# castling rights bits
+WHITE_KINGSIDE, WHITE_QUEENSIDE, BLACK_KINGSIDE, BLACK_QUEENSIDE = 1, 2, 4, 8
+
+# rights that survive a move touching a square (row * 8 + col): moving the
+# king or a rook, or capturing on a rook's corner, clears the matching bits
+CASTLING_MASK = [15] * 64
+CASTLING_MASK[0] = 15 & ~WHITE_QUEENSIDE
+CASTLING_MASK[7] = 15 & ~WHITE_KINGSIDE
+CASTLING_MASK[4] = 15 & ~(WHITE_KINGSIDE | WHITE_QUEENSIDE)
+CASTLING_MASK[56] = 15 & ~BLACK_QUEENSIDE
+CASTLING_MASK[63] = 15 & ~BLACK_KINGSIDE
+CASTLING_MASK[60] = 15 & ~(BLACK_KINGSIDE | BLACK_QUEENSIDE)
+
+# zobrist keys (fixed seed so hashes are reproducible between runs)
+_zobrist_random = random.Random(340)
+ZOBRIST_PIECES = {
+    (piece_type, color): [_zobrist_random.getrandbits(64) for _ in range(64)]
+    for piece_type in [Pawn, Knight, Bishop, Rook, Queen, King]
+    for color in ['white', 'black']
+}
+ZOBRIST_BLACK_TO_MOVE = _zobrist_random.getrandbits(64)
+ZOBRIST_CASTLING = [_zobrist_random.getrandbits(64) for _ in range(16)]
+ZOBRIST_EN_PASSANT = [_zobrist_random.getrandbits(64) for _ in range(8)] # by file
+
+PIECE_VALUES = {Pawn: 100, Knight: 320, Bishop: 330, Rook: 500, Queen: 900, King: 20000}
+PIECE_TABLES = {
+    Pawn: PAWN_TABLE, Knight: KNIGHT_TABLE, Bishop: BISHOP_TABLE,
+    Rook: ROOK_TABLE, Queen: QUEEN_TABLE, King: KING_TABLE
+}
+
+# material + piece-square contribution of a piece on each square (row * 8 + col),
+# signed from white's point of view exactly like evaluate_board_full scores it
+PIECE_SQUARE_SCORES = {
+    (piece_type, color): [
+        (PIECE_VALUES[piece_type] if color == 'white' else -PIECE_VALUES[piece_type])
+        + PIECE_TABLES[piece_type][square // 8][square % 8]
+        for square in range(64)
+    ]
+    for piece_type in PIECE_VALUES
+    for color in ['white', 'black']
+}
+
+# the shared piece of every piece code, and zobrist keys and material +
+# piece-square scores by piece code for the move loop
+PIECES_BY_CODE = [None] + [piece_type(color) for color in COLORS
+                           for piece_type in (Pawn, Knight, Bishop, Rook, Queen, King)]
+ZOBRIST_CODES = [None] + [ZOBRIST_PIECES[type(piece), piece.color] for piece in PIECES_BY_CODE[1:]]
+SQUARE_SCORES = [None] + [PIECE_SQUARE_SCORES[type(piece), piece.color] for piece in PIECES_BY_CODE[1:]]
+PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING = range(6) # ChessPiece.kind
+# PIECE_VALUES by ChessPiece.kind
+KIND_VALUES = [PIECE_VALUES[piece_type] for piece_type in (Pawn, Knight, Bishop, Rook, Queen, King)]
+# (pawn, knight, bishop, rook, queen, king) of each color, so piece tests are identity checks
+SIDE_PIECES = {color: tuple(PIECES_BY_CODE[1 + 6 * side:7 + 6 * side]) for side, color in enumerate(COLORS)}
+
+FEN_PIECES = {'p': Pawn, 'n': Knight, 'b': Bishop, 'r': Rook, 'q': Queen, 'k': King}
+FEN_CASTLING = {'K': WHITE_KINGSIDE, 'Q': WHITE_QUEENSIDE, 'k': BLACK_KINGSIDE, 'q': BLACK_QUEENSIDE}
+FEN_SYMBOLS = {piece_type: symbol for symbol, piece_type in FEN_PIECES.items()}
+STARTING_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+
+# packed positions (ChessBoard.pack): a nibble per square, a1, b1, ... h8 with
+# the low nibble first (0 empty, 1-6 white pawn, knight, bishop, rook, queen,
+# king, 7-12 the black ones), then a state byte (castling rights in bits 0-3,
+# bit 4 set with black to move), the en passant file + 1 (0 for none), the
+# halfmove clock (at most 255) and the fullmove number (16 bits)
+PACKED_FORMAT = struct.Struct('>32sBBBH')
+PACKED_SIZE = PACKED_FORMAT.size
+
+
+# algebraic square name ('e4') <-> (row, col)
+def parse_square(name):
+    if len(name) != 2 or name[0] not in 'abcdefgh' or name[1] not in '12345678':
+        raise ValueError(f"invalid square: {name!r}")
+    return (int(name[1]) - 1, ord(name[0]) - ord('a'))
+
+
+def square_name(square):
+    return f"{chr(square[1] + ord('a'))}{square[0] + 1}"
+
+
+# coordinate notation of a move, e.g. 'e2e4' or 'e7e8n' for an underpromotion
+def move_to_uci(move):
+    text = square_name(move[0]) + square_name(move[1])
+    if len(move) > 2 and move[2] is not None:
+        text += str(move[2]('black'))
+    return text
+
+
+# the legal move written as text in coordinate notation. queen promotions
+# are plain (start, end) moves, so a trailing 'q' is optional
+def parse_uci_move(board, text):
+    text = text.strip().lower()
+    if len(text) == 5 and text[4] == 'q':
+        text = text[:4]
+    for move in board.legal_moves(underpromotions=True):
+        if move_to_uci(move) == text:
+            return move
+    raise ValueError(f"illegal move: {text!r}")
+
+
 class ChessBoard:
     def __init__(self):
         self.board = [[None for _ in range(8)] for _ in range(8)] #initialize the board
         self.initialize_board()
         self.en_passant_target = None
+        self.turn = 'white'
+        self.castling_rights = WHITE_KINGSIDE | WHITE_QUEENSIDE | BLACK_KINGSIDE | BLACK_QUEENSIDE
+        self.halfmove_clock = 0 # plies since the last capture or pawn move
+        self.fullmove_number = 1
+        self.recompute_state()
+
+    # builds a board from a FEN string
+    @classmethod
+    def from_fen(cls, fen):
+        fields = fen.split()
+        if len(fields) < 4:
+            raise ValueError(f"invalid FEN: {fen!r}")
+
+        grid = [[None for _ in range(8)] for _ in range(8)]
+        ranks = fields[0].split('/')
+        if len(ranks) != 8:
+            raise ValueError(f"invalid FEN board: {fields[0]!r}")
+        for i, rank in enumerate(ranks):
+            row = 7 - i
+            col = 0
+            for symbol in rank:
+                if symbol.isdigit():
+                    col += int(symbol)
+                elif symbol.lower() in FEN_PIECES and col < 8:
+                    grid[row][col] = FEN_PIECES[symbol.lower()]('white' if symbol.isupper() else 'black')
+                    col += 1
+                else:
+                    raise ValueError(f"invalid FEN rank: {rank!r}")
+            if col != 8:
+                raise ValueError(f"invalid FEN rank: {rank!r}")
+
+        if fields[1] not in ('w', 'b'):
+            raise ValueError(f"invalid side to move: {fields[1]!r}")
+
+        rights = 0
+        if fields[2] != '-':
+            for symbol in fields[2]:
+                if symbol not in FEN_CASTLING:
+                    raise ValueError(f"invalid castling rights: {fields[2]!r}")
+                rights |= FEN_CASTLING[symbol]
+
+        target = None
+        if fields[3] != '-':
+            target = parse_square(fields[3])
+
+        # the move counters are optional
+        try:
+            halfmove = int(fields[4]) if len(fields) > 4 else 0
+            fullmove = int(fields[5]) if len(fields) > 5 else 1
+        except ValueError:
+            raise ValueError(f"invalid move counters: {' '.join(fields[4:])!r}") from None
+        if halfmove < 0 or fullmove < 1:
+            raise ValueError(f"invalid move counters: {' '.join(fields[4:])!r}")
+
+        return cls._from_grid(grid, 'white' if fields[1] == 'w' else 'black', rights, target, halfmove, fullmove)
+
+    # the position packed into PACKED_SIZE bytes, see PACKED_FORMAT
+    def pack(self):
+        squares = [piece.code if piece else 0 for row in self.board for piece in row]
+        grid = bytes([squares[i] | squares[i + 1] << 4 for i in range(0, 64, 2)])
+        state = self.castling_rights | (16 if self.turn == 'black' else 0)
+        target = self.en_passant_target[1] + 1 if self.en_passant_target else 0
+        return PACKED_FORMAT.pack(grid, state, target, min(self.halfmove_clock, 255), min(self.fullmove_number, 0xFFFF))
+
+    @classmethod
+    def unpack(cls, data):
+        if len(data) != PACKED_SIZE:
+            raise ValueError(f"packed position must be {PACKED_SIZE} bytes, got {len(data)}")
+        squares, state, target, halfmove, fullmove = PACKED_FORMAT.unpack(data)
+        if state > 31 or target > 8 or fullmove < 1:
+            raise ValueError("invalid packed position state")
+
+        grid = [[None for _ in range(8)] for _ in range(8)]
+        for i, byte in enumerate(squares):
+            if not byte:
+                continue
+            for square, code in ((2 * i, byte & 15), (2 * i + 1, byte >> 4)):
+                if code > 12:
+                    raise ValueError(f"invalid packed piece code: {code}")
+                if code:
+                    grid[square >> 3][square & 7] = PIECES_BY_CODE[code]
+
+        turn = 'black' if state & 16 else 'white'
+        # the target square is behind the pawn that just moved two squares
+        target = ((5 if turn == 'white' else 2), target - 1) if target else None
+        return cls._from_grid(grid, turn, state & 15, target, halfmove, fullmove)
+
+    # board from a grid of pieces and the position state
+    @classmethod
+    def _from_grid(cls, grid, turn, rights, target, halfmove, fullmove):
+        # the target is behind a pawn that just moved two squares: rank 6 when
+        # white is to move, rank 3 when black is
+        if target is not None and target[0] != (5 if turn == 'white' else 2):
+            raise ValueError(f"invalid en passant square for {turn} to move: {square_name(target)}")
+        board = cls.__new__(cls)
+        board.board = grid
+        board.turn = turn
+        board.castling_rights = rights
+        board.en_passant_target = target
+        board.halfmove_clock = halfmove
+        board.fullmove_number = fullmove
+        board.recompute_state()
+        return board
+
+    # the position as a FEN string
+    def to_fen(self):
+        ranks = []
+        for row in range(7, -1, -1):
+            rank = ''
+            empty = 0
+            for piece in self.board[row]:
+                if piece is None:
+                    empty += 1
+                    continue
+                if empty:
+                    rank += str(empty)
+                    empty = 0
+                symbol = FEN_SYMBOLS[type(piece)]
+                rank += symbol.upper() if piece.color == 'white' else symbol
+            if empty:
+                rank += str(empty)
+            ranks.append(rank)
+
+        castling = ''.join(symbol for symbol, right in FEN_CASTLING.items() if self.castling_rights & right) or '-'
+        target = square_name(self.en_passant_target) if self.en_passant_target else '-'
+        return f"{'/'.join(ranks)} {'w' if self.turn == 'white' else 'b'} {castling} {target} {self.halfmove_clock} {self.fullmove_number}"
+
+    # rebuilds everything derived from the grid: hashes, king squares and the
+    # incremental evaluation terms. the move history is cleared
+    def recompute_state(self):
+        self.history = [] # undo records pushed by make_move
+        self.hash = self.compute_hash()
+        self.pawn_hash = self.compute_pawn_hash()
+        self.king_squares = self.find_kings()
+        self.reset_evaluation()
 
     def initialize_board(self):
         # Set up  the pawns
@@ -231,6 +524,72 @@ class ChessBoard:
             self.board[0][col] = piece_order[col]('white')
             self.board[7][col] = piece_order[col]('black')
 
+    # full zobrist key of the position, make_move keeps self.hash up to date incrementally
+    def compute_hash(self):
+        h = 0
+        for row in range(8):
+            for col in range(8):
+                piece = self.board[row][col]
+                if piece:
+                    h ^= ZOBRIST_PIECES[type(piece), piece.color][row * 8 + col]
+        if self.turn == 'black':
+            h ^= ZOBRIST_BLACK_TO_MOVE
+        h ^= ZOBRIST_CASTLING[self.castling_rights]
+        if self.en_passant_target:
+            h ^= ZOBRIST_EN_PASSANT[self.en_passant_target[1]]
+        return h
+
+    def find_kings(self):
+        king_squares = {'white': None, 'black': None}
+        for row in range(8):
+            for col in range(8):
+                piece = self.board[row][col]
+                if piece is not None and piece.kind == KING:
+                    king_squares[piece.color] = (row, col)
+        return king_squares
+
+    # zobrist key of the pawns only, identifies the pawn structure
+    def compute_pawn_hash(self):
+        h = 0
+        for row in range(8):
+            for col in range(8):
+                piece = self.board[row][col]
+                if piece is not None and piece.kind == PAWN:
+                    h ^= ZOBRIST_CODES[piece.code][row * 8 + col]
+        return h
+
+    # recomputes the incrementally maintained evaluation terms from the grid:
+    # material/piece-square sum, piece counts and pawns per file
+    def reset_evaluation(self):
+        self.material_score = 0
+        self.piece_counts = [0] * 13 # by piece code
+        self.pawn_files = [[0] * 8, [0] * 8] # by side, then file
+        for row in range(8):
+            for col in range(8):
+                piece = self.board[row][col]
+                if piece:
+                    self.material_score += SQUARE_SCORES[piece.code][row * 8 + col]
+                    self.piece_counts[piece.code] += 1
+                    if piece.kind == PAWN:
+                        self.pawn_files[piece.side][col] += 1
+
+    # applies (sign=1) or reverts (sign=-1) the counts and pawn files of a
+    # capture or promotion; the material score is restored from the undo record
+    def _update_counts(self, piece, start_col, end_col, captured, captured_col, promoted, sign):
+        counts = self.piece_counts
+        if captured is not None:
+            counts[captured.code] -= sign
+            if captured.kind == PAWN:
+                self.pawn_files[captured.side][captured_col] -= sign
+        if piece.kind == PAWN:
+            files = self.pawn_files[piece.side]
+            files[start_col] -= sign
+            if promoted is None:
+                files[end_col] += sign
+            else:
+                counts[piece.code] -= sign
+                counts[promoted.code] += sign
+
     def print_board(self):
         print("  a b c d e f g h")
         for row in range(7, -1, -1):
@@ -244,58 +603,218 @@ class ChessBoard:
             print(f"{row + 1}")
         print("  a b c d e f g h")
 
-    def move_piece(self, start, end):
-        start_row, start_col = start
-        end_row, end_col = end
+    def move_piece(self, start, end, promotion=None):
+        start = tuple(start)
+        end = tuple(end)
 
-        piece = self.board[start_row][start_col]
+        piece = self.board[start[0]][start[1]]
         if piece is None:
             return False
 
-        if (end_row, end_col) not in piece.valid_moves(self.board, start_row, start_col):
+        if (start, end) not in self.legal_moves(piece.color):
             return False
 
-        # Check if the move puts the player in check
-        temp_board = copy.deepcopy(self.board)
-        temp_board[end_row][end_col] = piece
-        temp_board[start_row][start_col] = None
-        if self.is_in_check(piece.color, temp_board):
-            return False
+        self.make_move(start, end, promotion)
+        return True
 
-        # Move the piece
-        self.board[end_row][end_col] = piece
-        self.board[start_row][start_col] = None
-        piece.has_moved = True
+    # plays a move without validating it and pushes an undo record so that
+    # unmake_move can restore the exact previous position (used by the search
+    # instead of deep-copying the board for every node)
+    def make_move(self, start, end, promotion=None):
+        start_row, start_col = start
+        end_row, end_col = end
+        board = self.board
+        start_index = start_row * 8 + start_col
+        end_index = end_row * 8 + end_col
+
+        piece = board[start_row][start_col]
+        captured = board[end_row][end_col]
+        captured_square = end
+        previous_target = self.en_passant_target
+        previous_castling = self.castling_rights
+        previous_hash = self.hash
+        previous_score = self.material_score
+        previous_pawn_hash = self.pawn_hash
+        previous_halfmove = self.halfmove_clock
+        kind = piece.kind
+        code = piece.code
+        promoted = None
+        castling_rook = None
+
+        # en passant: a pawn moving diagonally onto the empty target square
+        if kind == PAWN and end == previous_target and captured is None and start_col != end_col:
+            captured_square = (start_row, end_col)
+            captured = board[start_row][end_col]
+            board[start_row][end_col] = None
+
+        board[end_row][end_col] = piece
+        board[start_row][start_col] = None
 
         # pawn promotion at the last rank
-        if isinstance(piece, Pawn) and (end_row == 0 or end_row == 7):
-            self.board[end_row][end_col] = Queen(piece.color)
+        if kind == PAWN and (end_row == 0 or end_row == 7):
+            promoted = (promotion or Queen)(piece.color)
+            board[end_row][end_col] = promoted
 
-        #en passant
-        if isinstance(piece, Pawn) and abs(start_row - end_row) == 2:
+        # en passant target is only available right after a two-step move
+        if kind == PAWN and abs(start_row - end_row) == 2:
             self.en_passant_target = ((start_row + end_row) // 2, start_col)
-        elif self.en_passant_target:
-            if isinstance(piece, Pawn) and end == self.en_passant_target:
-                self.board[start_row][end_col] = None  # Remove the captured pawn
         else:
             self.en_passant_target = None
 
         # castling
-        if isinstance(piece, King) and abs(start_col - end_col) == 2:
-            if end_col > start_col:  # Kingside
-                rook = self.board[start_row][7]
-                self.board[start_row][5] = rook
-                self.board[start_row][7] = None
-                rook.has_moved = True
-            else:  # Queenside
-                rook = self.board[start_row][0]
-                self.board[start_row][3] = rook
-                self.board[start_row][0] = None
-                rook.has_moved = True
+        if kind == KING:
+            self.king_squares[piece.color] = end
+            if abs(start_col - end_col) == 2:
+                castling_rook = (7, 5) if end_col > start_col else (0, 3)
+                board[start_row][castling_rook[1]] = board[start_row][castling_rook[0]]
+                board[start_row][castling_rook[0]] = None
+
+        self.castling_rights = previous_castling & CASTLING_MASK[start_index] & CASTLING_MASK[end_index]
+        self.turn = 'black' if piece.side == 0 else 'white'
+        self.halfmove_clock = 0 if captured is not None or kind == PAWN else previous_halfmove + 1
+        if piece.side:
+            self.fullmove_number += 1
+
+        # update the zobrist key with only what this move changed
+        end_code = promoted.code if promoted else code
+        h = previous_hash ^ ZOBRIST_BLACK_TO_MOVE ^ ZOBRIST_CODES[code][start_index] ^ ZOBRIST_CODES[end_code][end_index]
+        if captured is not None:
+            h ^= ZOBRIST_CODES[captured.code][captured_square[0] * 8 + captured_square[1]]
+        if castling_rook:
+            rook_keys = ZOBRIST_CODES[code - KING + ROOK]
+            h ^= rook_keys[start_row * 8 + castling_rook[0]] ^ rook_keys[start_row * 8 + castling_rook[1]]
+        if previous_castling != self.castling_rights:
+            h ^= ZOBRIST_CASTLING[previous_castling] ^ ZOBRIST_CASTLING[self.castling_rights]
+        if previous_target:
+            h ^= ZOBRIST_EN_PASSANT[previous_target[1]]
+        if self.en_passant_target:
+            h ^= ZOBRIST_EN_PASSANT[self.en_passant_target[1]]
+        self.hash = h
+
+        # incremental evaluation terms
+        score = previous_score - SQUARE_SCORES[code][start_index] + SQUARE_SCORES[end_code][end_index]
+        if captured is not None:
+            score -= SQUARE_SCORES[captured.code][captured_square[0] * 8 + captured_square[1]]
+        if castling_rook:
+            rook_scores = SQUARE_SCORES[code - KING + ROOK]
+            score += rook_scores[start_row * 8 + castling_rook[1]] - rook_scores[start_row * 8 + castling_rook[0]]
+        self.material_score = score
+        if captured is not None or promoted is not None or kind == PAWN:
+            self._update_counts(piece, start_col, end_col, captured, captured_square[1], promoted, 1)
+
+            # pawn structure key only changes on pawn moves and pawn captures
+            if kind == PAWN:
+                pawn_keys = ZOBRIST_CODES[code]
+                self.pawn_hash ^= pawn_keys[start_index]
+                if promoted is None:
+                    self.pawn_hash ^= pawn_keys[end_index]
+            if captured is not None and captured.kind == PAWN:
+                self.pawn_hash ^= ZOBRIST_CODES[captured.code][captured_square[0] * 8 + captured_square[1]]
+
+        self.history.append((start, end, piece, captured, captured_square, previous_target, promoted,
+                             castling_rook, previous_castling, previous_hash, previous_score,
+                             previous_pawn_hash, previous_halfmove))
+
+    # passes the turn without moving (for null move pruning); its undo record
+    # starts with None and unmake_move takes it back like any other move
+    def make_null_move(self):
+        previous_target = self.en_passant_target
+        self.history.append((None, previous_target, self.hash))
+        h = self.hash ^ ZOBRIST_BLACK_TO_MOVE
+        if previous_target:
+            h ^= ZOBRIST_EN_PASSANT[previous_target[1]]
+        self.hash = h
+        self.en_passant_target = None
+        self.turn = 'black' if self.turn == 'white' else 'white'
+
+    # takes back the last move played with make_move or make_null_move
+    def unmake_move(self):
+        record = self.history.pop()
+        if record[0] is None:
+            # null move
+            _, self.en_passant_target, self.hash = record
+            self.turn = 'black' if self.turn == 'white' else 'white'
+            return
+
+        (start, end, piece, captured, captured_square, previous_target, promoted,
+         castling_rook, previous_castling, previous_hash, previous_score,
+         previous_pawn_hash, previous_halfmove) = record
+        board = self.board
+
+        if castling_rook:
+            row = start[0]
+            board[row][castling_rook[0]] = board[row][castling_rook[1]]
+            board[row][castling_rook[1]] = None
+
+        board[end[0]][end[1]] = None
+        board[start[0]][start[1]] = piece
+        if piece.kind == KING:
+            self.king_squares[piece.color] = start
+        if captured is not None:
+            board[captured_square[0]][captured_square[1]] = captured
+
+        self.en_passant_target = previous_target
+        self.castling_rights = previous_castling
+        self.hash = previous_hash
+        self.turn = piece.color
+        self.material_score = previous_score
+        self.pawn_hash = previous_pawn_hash
+        self.halfmove_clock = previous_halfmove
+        if piece.side:
+            self.fullmove_number -= 1
+        if captured is not None or promoted is not None or piece.kind == PAWN:
+            self._update_counts(piece, start[1], end[1], captured, captured_square[1], promoted, -1)
+
+    # looks outward from the square for an attacker of the given color and
+    # stops at the first one found. a piece on the ignore square doesn't block
+    # rays (used to test king steps as if the king had already left)
+    def is_square_attacked(self, row, col, by_color, ignore=None):
+        board = self.board
+        pawn, knight, bishop, rook, queen, king = SIDE_PIECES[by_color]
+
+        # pawns attack towards the opponent, so look one row back from their side
+        pawn_row = row - 1 if by_color == 'white' else row + 1
+        if 0 <= pawn_row < 8:
+            if (col > 0 and board[pawn_row][col - 1] is pawn) or (col < 7 and board[pawn_row][col + 1] is pawn):
+                return True
+
+        for dr, dc in KNIGHT_OFFSETS:
+            r, c = row + dr, col + dc
+            if 0 <= r < 8 and 0 <= c < 8 and board[r][c] is knight:
+                return True
 
-        return True
+        for dr, dc in KING_OFFSETS:
+            r, c = row + dr, col + dc
+            if 0 <= r < 8 and 0 <= c < 8 and board[r][c] is king:
+                return True
+
+        # sliding pieces: the first piece on each ray decides
+        for directions, slider in ((ROOK_DIRECTIONS, rook), (BISHOP_DIRECTIONS, bishop)):
+            for dr, dc in directions:
+                r, c = row + dr, col + dc
+                while 0 <= r < 8 and 0 <= c < 8:
+                    piece = board[r][c]
+                    if piece and (r, c) != ignore:
+                        if piece is slider or piece is queen:
+                            return True
+                        break
+                    r, c = r + dr, c + dc
+
+        return False
 
     def is_in_check(self, color, board=None):
+        # a separate grid has no tracked king, fall back to the full scan
+        if board is not None:
+            return self.is_in_check_reference(color, board)
+
+        king_position = self.king_squares[color]
+        if king_position is None:
+            return False
+        return self.is_square_attacked(king_position[0], king_position[1], 'black' if color == 'white' else 'white')
+
+    # original implementation: finds the king and generates every opponent
+    # move. much slower, kept to cross-check is_in_check
+    def is_in_check_reference(self, color, board=None):
         if board is None:
             board = self.board
 
@@ -320,39 +839,197 @@ class ChessBoard:
                         return True
         return False
 
+    # cheapest piece of the given color attacking the square, as
+    # ((row, col), value), or None. pieces on the removed squares are treated
+    # as gone, which lets sliders behind them (x-rays) join the exchange
+    def least_valuable_attacker(self, row, col, color, removed=()):
+        board = self.board
+        pawn, knight, bishop, rook, queen, king = SIDE_PIECES[color]
+
+        pawn_row = row - 1 if color == 'white' else row + 1
+        if 0 <= pawn_row < 8:
+            for c in (col - 1, col + 1):
+                if 0 <= c < 8 and board[pawn_row][c] is pawn and (pawn_row, c) not in removed:
+                    return (pawn_row, c), KIND_VALUES[PAWN]
+
+        for dr, dc in KNIGHT_OFFSETS:
+            r, c = row + dr, col + dc
+            if 0 <= r < 8 and 0 <= c < 8 and board[r][c] is knight and (r, c) not in removed:
+                return (r, c), KIND_VALUES[KNIGHT]
+
+        best = None
+        for directions, slider in ((BISHOP_DIRECTIONS, bishop), (ROOK_DIRECTIONS, rook)):
+            for dr, dc in directions:
+                r, c = row + dr, col + dc
+                while 0 <= r < 8 and 0 <= c < 8:
+                    piece = board[r][c]
+                    if piece and (r, c) not in removed:
+                        if piece is slider or piece is queen:
+                            value = KIND_VALUES[piece.kind]
+                            if best is None or value < best[1]:
+                                best = ((r, c), value)
+                        break
+                    r, c = r + dr, c + dc
+        if best is not None:
+            return best
+
+        for dr, dc in KING_OFFSETS:
+            r, c = row + dr, col + dc
+            if 0 <= r < 8 and 0 <= c < 8 and board[r][c] is king and (r, c) not in removed:
+                return (r, c), KIND_VALUES[KING]
+        return None
+
+    # squares giving check to the king of the given color, the squares that
+    # resolve a single check (checker plus the ray between) and pinned pieces
+    # mapped to the direction of their pin line
+    def checks_and_pins(self, color):
+        board = self.board
+        king_row, king_col = self.king_squares[color]
+        enemy = 'black' if color == 'white' else 'white'
+        pawn, knight, bishop, rook, queen, _ = SIDE_PIECES[enemy]
+        checkers = []
+        block_squares = set()
+        pins = {}
+
+        pawn_row = king_row + (1 if color == 'white' else -1)
+        if 0 <= pawn_row < 8:
+            for c in (king_col - 1, king_col + 1):
+                if 0 <= c < 8 and board[pawn_row][c] is pawn:
+                    checkers.append((pawn_row, c))
+                    block_squares.add((pawn_row, c))
+
+        for dr, dc in KNIGHT_OFFSETS:
+            r, c = king_row + dr, king_col + dc
+            if 0 <= r < 8 and 0 <= c < 8 and board[r][c] is knight:
+                checkers.append((r, c))
+                block_squares.add((r, c))
+
+        for directions, slider in ((ROOK_DIRECTIONS, rook), (BISHOP_DIRECTIONS, bishop)):
+            for dr, dc in directions:
+                ray = []
+                pinned = None
+                r, c = king_row + dr, king_col + dc
+                while 0 <= r < 8 and 0 <= c < 8:
+                    piece = board[r][c]
+                    if piece:
+                        if piece.color == color:
+                            # a second own piece on the ray means no pin
+                            if pinned:
+                                break
+                            pinned = (r, c)
+                        else:
+                            if piece is slider or piece is queen:
+                                if pinned:
+                                    pins[pinned] = (dr, dc)
+                                else:
+                                    checkers.append((r, c))
+                                    block_squares.update(ray)
+                                    block_squares.add((r, c))
+                            break
+                    ray.append((r, c))
+                    r, c = r + dr, c + dc
+
+        return checkers, block_squares, pins
+
+    # fully legal moves for the given color (default: side to move), as
+    # (start, end) pairs. pins and checks are worked out once for the position,
+    # so apart from en passant no move is played to test it. with
+    # underpromotions=True a promotion also appears as (start, end, Rook),
+    # (start, end, Bishop) and (start, end, Knight); pass any move to make_move(*move)
+    def legal_moves(self, color=None, underpromotions=False):
+        if color is None:
+            color = self.turn
+        enemy = 'black' if color == 'white' else 'white'
+        board = self.board
+        king = self.king_squares[color]
+        if king is None:
+            return self.pseudo_legal_moves(color)
+        king_row, king_col = king
+        checkers, block_squares, pins = self.checks_and_pins(color)
+        double_check = len(checkers) > 1
+        last_row = 7 if color == 'white' else 0
+        moves = []
+
+        for start, end in self.pseudo_legal_moves(color):
+            if start == king:
+                if not self.is_square_attacked(end[0], end[1], enemy, ignore=king):
+                    moves.append((start, end))
+                continue
+            if double_check:
+                continue
+            if checkers and end not in block_squares:
+                continue
+            if start in pins:
+                # a pinned piece can only move along the line through its king
+                dr, dc = pins[start]
+                if (end[0] - king_row) * dc != (end[1] - king_col) * dr:
+                    continue
+            moves.append((start, end))
+            if underpromotions and end[0] == last_row and board[start[0]][start[1]].kind == PAWN:
+                for promotion in (Rook, Bishop, Knight):
+                    moves.append((start, end, promotion))
+
+        # en passant: rare enough to just try it, which also covers the pawn
+        # pair leaving a rank and uncovering a check
+        target = self.en_passant_target
+        if target and not double_check and color == self.turn:
+            direction = 1 if color == 'white' else -1
+            from_row = target[0] - direction
+            own_pawn = SIDE_PIECES[color][PAWN]
+            for c in (target[1] - 1, target[1] + 1):
+                if 0 <= c < 8:
+                    if board[from_row][c] is own_pawn:
+                        self.make_move((from_row, c), target)
+                        if not self.is_in_check(color):
+                            moves.append(((from_row, c), target))
+                        self.unmake_move()
+
+        # castling: rights left, path empty and the king never crosses an attacked square
+        if not checkers:
+            rights = self.castling_rights
+            row = 0 if color == 'white' else 7
+            kingside, queenside = (WHITE_KINGSIDE, WHITE_QUEENSIDE) if color == 'white' else (BLACK_KINGSIDE, BLACK_QUEENSIDE)
+            own_rook = SIDE_PIECES[color][ROOK]
+            if king == (row, 4):
+                if (rights & kingside and board[row][7] is own_rook
+                        and board[row][5] is None and board[row][6] is None
+                        and not self.is_square_attacked(row, 5, enemy)
+                        and not self.is_square_attacked(row, 6, enemy)):
+                    moves.append((king, (row, 6)))
+                if (rights & queenside and board[row][0] is own_rook
+                        and board[row][1] is None and board[row][2] is None and board[row][3] is None
+                        and not self.is_square_attacked(row, 3, enemy)
+                        and not self.is_square_attacked(row, 2, enemy)):
+                    moves.append((king, (row, 2)))
+
+        return moves
+
+    # true if the given color has at least one legal move
+    def has_legal_move(self, color):
+        return len(self.legal_moves(color)) > 0
+
     def is_checkmate(self, color):
         if not self.is_in_check(color):
             return False
 
         # check valid moves for the king to get out of the chekc
-        for row in range(8):
-            for col in range(8):
-                piece = self.board[row][col]
-                if piece and piece.color == color:
-                    for move in piece.valid_moves(self.board, row, col):
-                        temp_board = copy.deepcopy(self.board)
-                        temp_board[move[0]][move[1]] = piece
-                        temp_board[row][col] = None
-                        if not self.is_in_check(color, temp_board):
-                            return False
-        return True
+        return not self.has_legal_move(color)
 
     def is_stalemate(self, color):
         if self.is_in_check(color):
             return False
 
         # Check if any legal move is available
-        for row in range(8):
-            for col in range(8):
-                piece = self.board[row][col]
-                if piece and piece.color == color:
-                    for move in piece.valid_moves(self.board, row, col):
-                        temp_board = copy.deepcopy(self.board)
-                        temp_board[move[0]][move[1]] = piece
-                        temp_board[row][col] = None
-                        if not self.is_in_check(color, temp_board):
-                            return False
-        return True
+        return not self.has_legal_move(color)
+
+    # every (start, end) pair allowed by the pieces' valid_moves; moves that
+    # leave the king in check are still included and filtered by the caller
+    def pseudo_legal_moves(self, color):
+        moves = []
+        for piece, (row, col) in self.get_all_pieces(color):
+            for move in piece.valid_moves(self.board, row, col):
+                moves.append(((row, col), move))
+        return moves
 
     def get_all_pieces(self, color):
         pieces = []
@@ -364,8 +1041,78 @@ class ChessBoard:
         return pieces
 
 
+# set to True to cross-check every incremental evaluation against evaluate_board_full
+DEBUG_INCREMENTAL_EVAL = False
+
+# doubled (50 per other pawn on the file) and isolated (30) pawn penalties
+# for one side, from its number of pawns on each file
+def pawn_structure_penalty(files):
+    penalty = 0
+    for col in range(8):
+        count = files[col]
+        if count:
+            penalty += count * (count - 1) * 50
+            if (col == 0 or not files[col - 1]) and (col == 7 or not files[col + 1]):
+                penalty += count * 30
+    return penalty
+
+
+# bounded cache of pawn structure scores keyed by the pawn hash. slots are
+# direct-mapped, a new skeleton evicts whatever was stored in its slot
+class PawnHashTable:
+    def __init__(self, size=1 << 14):
+        self.size = size
+        self.keys = [None] * size
+        self.scores = [0] * size
+        self.hits = 0
+        self.misses = 0
+
+    def score(self, board):
+        key = board.pawn_hash
+        index = key % self.size
+        if self.keys[index] == key:
+            self.hits += 1
+            return self.scores[index]
+
+        self.misses += 1
+        score = pawn_structure_penalty(board.pawn_files[1]) - pawn_structure_penalty(board.pawn_files[0])
+        self.keys[index] = key
+        self.scores[index] = score
+        return score
+
+
+# shared by every search in the process
+PAWN_HASH_TABLE = PawnHashTable()
+
+
 # Evaluation Function
+# same score as evaluate_board_full, built from the terms the board keeps up
+# to date in make_move/unmake_move instead of rescanning all 64 squares
 def evaluate_board(board):
+    counts = board.piece_counts # by piece code: 1 + kind for white, 7 + kind for black
+    score = board.material_score + PAWN_HASH_TABLE.score(board)
+
+    # bishop pair: every bishop of a side with two or more is worth 50
+    white_bishops = counts[1 + BISHOP]
+    black_bishops = counts[7 + BISHOP]
+    if white_bishops >= 2:
+        score += 50 * white_bishops
+    if black_bishops >= 2:
+        score -= 50 * black_bishops
+
+    # knights are better with more pawns on the board
+    pawn_count = counts[1 + PAWN] + counts[7 + PAWN]
+    score += (counts[1 + KNIGHT] - counts[7 + KNIGHT]) * pawn_count * 2
+
+    if DEBUG_INCREMENTAL_EVAL:
+        expected = evaluate_board_full(board)
+        if score != expected:
+            raise AssertionError(f"incremental evaluation {score} != full evaluation {expected}")
+    return score
+
+
+# full rescan of the board, kept as the reference for evaluate_board
+def evaluate_board_full(board):
     score = 0
     piece_values = {
         'P': 100,   # Increased base values to make position scoring more meaningful
@@ -460,120 +1207,1012 @@ def evaluate_board(board):
     return score
 
 
+# score of a checkmate; the remaining depth is added so quicker mates score higher
+MATE_SCORE = 1000000
+
+
+# score of a position where color has no legal moves: mated or stalemate
+def terminal_score(board, color, depth):
+    if not board.is_in_check(color):
+        return 0
+    return -(MATE_SCORE + depth) if color == 'white' else MATE_SCORE + depth
+
+
 # writing the minimax function
-def minimax(board, depth, maximizing_player):
+def minimax(board, depth, maximizing_player, stats=None):
+    if stats is not None:
+        stats.nodes += 1
     if depth == 0:
-        return evaluate_board(board.board)
+        if stats is not None:
+            stats.leaf_evals += 1
+        return evaluate_board(board)
+
+    color = 'white' if maximizing_player else 'black'
+    moves = board.legal_moves(color)
+    if not moves:
+        return terminal_score(board, color, depth)
     
     if maximizing_player:
         max_eval = float('-inf')
-        for piece, (row, col) in board.get_all_pieces('white'):
-            for move in piece.valid_moves(board.board, row, col):
-                new_board = copy.deepcopy(board)
-                if new_board.move_piece((row, col), move):
-                    evaluation = minimax(new_board, depth - 1, False)
-                    max_eval = max(max_eval, evaluation)
+        for move in moves:
+            board.make_move(*move)
+            evaluation = minimax(board, depth - 1, False, stats)
+            board.unmake_move()
+            max_eval = max(max_eval, evaluation)
         return max_eval
     else:
         min_eval = float('inf')
-        for piece, (row, col) in board.get_all_pieces('black'):
-            for move in piece.valid_moves(board.board, row, col):
-                new_board = copy.deepcopy(board)
-                if new_board.move_piece((row, col), move):
-                    evaluation = minimax(new_board, depth - 1, True)
-                    min_eval = min(min_eval, evaluation)
+        for move in moves:
+            board.make_move(*move)
+            evaluation = minimax(board, depth - 1, True, stats)
+            board.unmake_move()
+            min_eval = min(min_eval, evaluation)
         return min_eval
     
 
-def alphabeta(board, depth, alpha, beta, maximizing_player):
+# transposition table bound types
+EXACT, LOWER_BOUND, UPPER_BOUND = 0, 1, 2
+# stored mate scores are within this many points of MATE_SCORE, see stored_score
+MATE_DISTANCE_LIMIT = 10000
+
+
+# a mate score counts the depth left at the mated node, so it is only right
+# for the depth its node was searched with. the table keeps mate scores
+# relative to the node (MATE_SCORE minus the depth to mate) and probed_score
+# turns them back into a score for the depth of the node probing them
+def stored_score(score, depth):
+    if score >= MATE_SCORE:
+        return score - depth
+    if score <= -MATE_SCORE:
+        return score + depth
+    return score
+
+
+def probed_score(score, depth):
+    if score > MATE_SCORE - MATE_DISTANCE_LIMIT:
+        return score + depth
+    if score < MATE_DISTANCE_LIMIT - MATE_SCORE:
+        return score - depth
+    return score
+
+# fixed-size transposition table keyed by zobrist hash. every bucket has a
+# depth-preferred slot and an always-replace slot; entries are tuples
+# (key, depth, score, bound, best_move, generation)
+class TranspositionTable:
+    def __init__(self, size=1 << 16):
+        self.size = size
+        self.depth_preferred = [None] * size
+        self.always_replace = [None] * size
+        self.generation = 0
+
+    # called once per root search; entries from older searches stay usable
+    # but may be overwritten by the depth-preferred slot
+    def new_search(self):
+        self.generation += 1
+
+    def probe(self, key):
+        index = key % self.size
+        entry = self.depth_preferred[index]
+        if entry is not None and entry[0] == key:
+            return entry
+        entry = self.always_replace[index]
+        if entry is not None and entry[0] == key:
+            return entry
+        return None
+
+    def store(self, key, depth, score, bound, best_move):
+        index = key % self.size
+        entry = (key, depth, score, bound, best_move, self.generation)
+        current = self.depth_preferred[index]
+        if current is None or current[0] == key or depth >= current[1] or current[5] != self.generation:
+            self.depth_preferred[index] = entry
+        else:
+            self.always_replace[index] = entry
+
+    def clear(self):
+        self.depth_preferred = [None] * self.size
+        self.always_replace = [None] * self.size
+
+
+# raised inside the search when the time budget runs out or the search is
+# stopped; the caller unwinds the board with unmake_move
+class SearchTimeout(Exception):
+    pass
+
+
+# plies the killer table has room for
+MAX_PLY = 128
+
+# ordering score bands: hash move, then captures/promotions, then killers,
+# then quiet moves by history score (kept below the killer band)
+HASH_MOVE_SCORE = 10000000
+CAPTURE_SCORE = 1000000
+KILLER_SCORE = 900000
+
+
+# true for captures (including en passant) and promotions
+def is_tactical(board, move):
+    start, end = move[0], move[1]
+    if board.board[end[0]][end[1]] is not None:
+        return True
+    return board.board[start[0]][start[1]].kind == PAWN and (start[1] != end[1] or end[0] in (0, 7))
+
+
+# material the side making a capture can expect to win on the target square
+# if both sides keep recapturing with their cheapest attacker and may stop
+# whenever continuing would lose (swap-list algorithm)
+def static_exchange(board, move):
+    start, end = move[0], move[1]
+    grid = board.board
+    piece = grid[start[0]][start[1]]
+    victim = grid[end[0]][end[1]]
+    if victim is not None:
+        gain = [KIND_VALUES[victim.kind]]
+    elif piece.kind == PAWN and start[1] != end[1]:
+        gain = [KIND_VALUES[PAWN]] # en passant
+    else:
+        gain = [0]
+
+    attacker_value = KIND_VALUES[piece.kind]
+    removed = {start}
+    side = 'black' if piece.color == 'white' else 'white'
+    while True:
+        # what this side wins if the piece that just captured is taken
+        gain.append(attacker_value - gain[-1])
+        if max(-gain[-2], gain[-1]) < 0:
+            break
+        attacker = board.least_valuable_attacker(end[0], end[1], side, removed)
+        if attacker is None:
+            break
+        square, attacker_value = attacker
+        removed.add(square)
+        side = 'black' if side == 'white' else 'white'
+
+    # the last entry is speculative; fold the rest back to the first capture
+    depth = len(gain) - 2
+    while depth > 0:
+        gain[depth - 1] = -max(-gain[depth - 1], gain[depth])
+        depth -= 1
+    return gain[0]
+
+
+# captures only pay off in quiescence if they can still lift the score this
+# close to alpha (beta for the minimizing side)
+DELTA_MARGIN = 200
+
+
+# searches captures and promotions until the position is quiet, so leaves
+# aren't evaluated in the middle of an exchange. the side to move may
+# "stand pat" on the static evaluation instead of capturing; losing captures
+# (negative SEE) and captures that can't reach the window are skipped.
+# in check every evasion is searched since standing pat isn't an option
+def quiescence(board, alpha, beta, maximizing_player, context=None):
+    stats = None
+    if context is not None:
+        context.count_node()
+        stats = context.stats
+        if stats is not None:
+            stats.quiescence_nodes += 1
+    color = 'white' if maximizing_player else 'black'
+    in_check = board.is_in_check(color)
+    moves = board.legal_moves(color)
+    if not moves:
+        return terminal_score(board, color, 0)
+
+    if in_check:
+        stand_pat = float('-inf') if maximizing_player else float('inf')
+    else:
+        stand_pat = evaluate_board(board)
+        if stats is not None:
+            stats.leaf_evals += 1
+        if maximizing_player:
+            if stand_pat >= beta:
+                return stand_pat
+            alpha = max(alpha, stand_pat)
+        else:
+            if stand_pat <= alpha:
+                return stand_pat
+            beta = min(beta, stand_pat)
+
+        candidates = []
+        grid = board.board
+        for move in moves:
+            if not is_tactical(board, move):
+                continue
+            victim = grid[move[1][0]][move[1][1]]
+            gain = KIND_VALUES[victim.kind] if victim is not None else KIND_VALUES[PAWN]
+            if move[1][0] in (0, 7) and grid[move[0][0]][move[0][1]].kind == PAWN:
+                gain += KIND_VALUES[QUEEN] - KIND_VALUES[PAWN]
+            # delta pruning
+            if maximizing_player and stand_pat + gain + DELTA_MARGIN < alpha:
+                continue
+            if not maximizing_player and stand_pat - gain - DELTA_MARGIN > beta:
+                continue
+            if victim is not None and static_exchange(board, move) < 0:
+                continue
+            candidates.append(move)
+        moves = order_by_mvv_lva(board, candidates)
+
+    best = stand_pat
+    for move in moves:
+        board.make_move(*move)
+        score = quiescence(board, alpha, beta, not maximizing_player, context)
+        board.unmake_move()
+        if maximizing_player:
+            best = max(best, score)
+            alpha = max(alpha, score)
+        else:
+            best = min(best, score)
+            beta = min(beta, score)
+        if beta <= alpha:
+            break
+    return best
+
+
+# most valuable victim first, cheapest attacker first among equal victims
+def mvv_lva(board, move):
+    start, end = move[0], move[1]
+    victim = board.board[end[0]][end[1]]
+    attacker = KIND_VALUES[board.board[start[0]][start[1]].kind]
+    if victim is None:
+        # en passant (pawn takes pawn) or a quiet promotion
+        return 10 * KIND_VALUES[PAWN] - attacker
+    return 10 * KIND_VALUES[victim.kind] - attacker
+
+
+def order_by_mvv_lva(board, moves):
+    return sorted(moves, key=lambda move: mvv_lva(board, move), reverse=True)
+
+
+# move ordering for alphabeta: hash move first, captures by MVV-LVA (most
+# valuable victim, least valuable attacker), two killer moves per ply, then
+# quiet moves by how often they caused cutoffs (history heuristic)
+class MoveOrderer:
+    def __init__(self):
+        self.killers = [[None, None] for _ in range(MAX_PLY)]
+        self.history = {}
+
+    # killers are position specific, history is halved so older searches fade
+    def new_search(self):
+        self.killers = [[None, None] for _ in range(MAX_PLY)]
+        self.history = {key: value // 2 for key, value in self.history.items() if value > 1}
+
+    def order(self, board, moves, hash_move=None, ply=0):
+        grid = board.board
+        killers = self.killers[ply] if ply < MAX_PLY else (None, None)
+        history = self.history
+        scored = []
+        for move in moves:
+            start, end = move[0], move[1]
+            piece = grid[start[0]][start[1]]
+            victim = grid[end[0]][end[1]]
+            if move == hash_move:
+                score = HASH_MOVE_SCORE
+            elif victim is not None or (piece.kind == PAWN and (start[1] != end[1] or end[0] in (0, 7))):
+                score = CAPTURE_SCORE + mvv_lva(board, move)
+            elif move == killers[0]:
+                score = KILLER_SCORE
+            elif move == killers[1]:
+                score = KILLER_SCORE - 1
+            else:
+                score = min(history.get((piece.color, start, end), 0), KILLER_SCORE - 2)
+            scored.append((score, move))
+        scored.sort(key=lambda item: item[0], reverse=True)
+        return [move for _, move in scored]
+
+    # called when a move fails high; only quiet moves become killers and
+    # earn history, captures are already ordered well by MVV-LVA
+    def record_cutoff(self, board, move, depth, ply):
+        start, end = move[0], move[1]
+        piece = board.board[start[0]][start[1]]
+        if board.board[end[0]][end[1]] is not None or (piece.kind == PAWN and start[1] != end[1]):
+            return
+        if ply < MAX_PLY:
+            killers = self.killers[ply]
+            if killers[0] != move:
+                killers[1] = killers[0]
+                killers[0] = move
+        key = (piece.color, start, end)
+        self.history[key] = self.history.get(key, 0) + depth * depth
+
+
+# per-search state shared by every node: deadline, node count, move ordering
+# and cutoff statistics
+class SearchContext:
+    def __init__(self, deadline=None, orderer=None, root_ply=0, quiescence=False, pvs=False,
+                 null_move=False, lmr=False, futility=False, tablebase=None, stop=None, stats=None,
+                 node_limit=None):
+        self.deadline = deadline
+        self.node_limit = node_limit # nodes after which the search stops like at the deadline
+        self.stats = stats # SearchStats, or None when statistics are off
+        self.stop = stop # threading.Event that ends the search when set, checked with the clock
+        self.orderer = orderer
+        self.root_ply = root_ply # len(board.history) at the root, to know the ply of a node
+        self.quiescence = quiescence # resolve captures at the leaves instead of evaluating directly
+        self.pvs = pvs # null-window search for every move after the first
+        self.researches = 0 # null-window searches that failed high and were repeated
+        # selective search switches and how often each one fired
+        self.null_move = null_move
+        self.lmr = lmr
+        self.futility = futility
+        self.selective = null_move or lmr or futility
+        self.null_move_cutoffs = 0
+        self.reductions = 0
+        self.reduction_researches = 0
+        self.futility_prunes = 0
+        self.reverse_futility_prunes = 0
+        self.tablebase = tablebase # endgame tables probed below the root (tablebase.py)
+        self.tablebase_hits = 0
+        self.nodes = 0
+        self.cutoffs = 0
+        self.first_move_cutoffs = 0
+
+    # share of beta cutoffs caused by the first move searched; close to 1.0
+    # means the ordering puts the best move first almost every time
+    def first_move_cutoff_rate(self):
+        return self.first_move_cutoffs / self.cutoffs if self.cutoffs else 0.0
+
+    def record_cutoff(self, board, move, depth, index):
+        self.cutoffs += 1
+        if index == 0:
+            self.first_move_cutoffs += 1
+        if self.stats is not None:
+            self.stats.cutoff_index[min(index, CUTOFF_SLOTS - 1)] += 1
+        if self.orderer is not None:
+            self.orderer.record_cutoff(board, move, depth, len(board.history) - self.root_ply)
+
+    # the clock and the node limit are only checked every 128 nodes
+    def count_node(self):
+        self.nodes += 1
+        if not self.nodes & 127:
+            if self.stop is not None and self.stop.is_set():
+                raise SearchTimeout()
+            if self.deadline is not None and time.perf_counter() >= self.deadline:
+                raise SearchTimeout()
+            if self.node_limit is not None and self.nodes >= self.node_limit:
+                raise SearchTimeout()
+
+
+# cutoffs at move index CUTOFF_SLOTS - 1 or later share the last slot of
+# SearchStats.cutoff_index
+CUTOFF_SLOTS = 8
+
+
+# statistics of one search, collected when a bot is created with stats on.
+# while they are off the search only tests context.stats for None, so they
+# can stay in normal builds
+class SearchStats:
+    def __init__(self, fen, color):
+        self.fen = fen
+        self.color = color
+        self.nodes = 0
+        self.quiescence_nodes = 0
+        self.leaf_evals = 0 # evaluate_board calls at the leaves and in quiescence
+        self.cutoff_index = [0] * CUTOFF_SLOTS # beta cutoffs by the index of the cutoff move
+        self.tt_probes = 0
+        self.tt_hits = 0
+        self.tt_cutoffs = 0 # probes whose stored score ended the node
+        self.iterations = [] # one dict per finished depth
+        self.counters = {} # selective search counters of the SearchContext
+        self.move = None
+        self.score = None
+        self.start_time = time.perf_counter()
+        self.elapsed = 0.0
+        self._iteration_start = (self.start_time, 0)
+
+    # called after each finished depth of iterative deepening, with the total nodes so far
+    def record_iteration(self, depth, nodes, move, score):
+        now = time.perf_counter()
+        start, start_nodes = self._iteration_start
+        self._iteration_start = (now, nodes)
+        iteration = {'depth': depth, 'nodes': nodes - start_nodes, 'time': round(now - start, 6),
+                     'move': move_to_uci(move), 'score': score}
+        if self.iterations and self.iterations[-1]['nodes']:
+            iteration['ebf'] = round(iteration['nodes'] / self.iterations[-1]['nodes'], 3)
+        self.iterations.append(iteration)
+
+    def finish(self, nodes, move, score, context=None):
+        self.elapsed = time.perf_counter() - self.start_time
+        self.nodes = nodes
+        self.move = move
+        self.score = score
+        if context is not None:
+            self.counters = {
+                'null_move_cutoffs': context.null_move_cutoffs,
+                'reductions': context.reductions,
+                'reduction_researches': context.reduction_researches,
+                'futility_prunes': context.futility_prunes,
+                'reverse_futility_prunes': context.reverse_futility_prunes,
+                'pvs_researches': context.researches,
+                'tablebase_hits': context.tablebase_hits,
+            }
+
+    @property
+    def cutoffs(self):
+        return sum(self.cutoff_index)
+
+    # nodes of the last finished depth over those of the one before
+    @property
+    def effective_branching_factor(self):
+        if len(self.iterations) < 2 or not self.iterations[-2]['nodes']:
+            return None
+        return self.iterations[-1]['nodes'] / self.iterations[-2]['nodes']
+
+    def to_dict(self):
+        ebf = self.effective_branching_factor
+        return {
+            'fen': self.fen,
+            'color': self.color,
+            'move': move_to_uci(self.move) if self.move else None,
+            'score': self.score,
+            'nodes': self.nodes,
+            'quiescence_nodes': self.quiescence_nodes,
+            'leaf_evals': self.leaf_evals,
+            'time': round(self.elapsed, 6),
+            'nps': round(self.nodes / self.elapsed) if self.elapsed > 0 else 0,
+            'cutoffs': self.cutoffs,
+            'first_move_cutoff_rate': round(self.cutoff_index[0] / self.cutoffs, 4) if self.cutoffs else None,
+            'cutoff_index': self.cutoff_index,
+            'tt_probes': self.tt_probes,
+            'tt_hits': self.tt_hits,
+            'tt_cutoffs': self.tt_cutoffs,
+            'ebf': round(ebf, 3) if ebf is not None else None,
+            'iterations': self.iterations,
+            **self.counters,
+        }
+
+    def to_json(self):
+        return json.dumps(self.to_dict())
+
+
+# stats argument of the bots: False for none, True to keep the SearchStats of
+# the last search on bot.stats, or a path or text file to also append each
+# search to it as a JSON line. returns (collect, log file, whether we opened it)
+def open_stats_log(stats):
+    if isinstance(stats, str):
+        return True, open(stats, 'a'), True
+    if stats is True or stats is False or stats is None:
+        return bool(stats), None, False
+    return True, stats, False
+
+
+def write_stats(log, stats):
+    log.write(stats.to_json() + '\n')
+    log.flush()
+
+
+# selective search parameters
+NULL_MOVE_REDUCTION = 2
+NULL_MOVE_MIN_DEPTH = 3
+LMR_MIN_DEPTH = 3
+LMR_FULL_MOVES = 3 # moves searched at full depth before reductions start
+FUTILITY_MARGINS = [0, 200, 500] # by remaining depth
+
+
+# null move pruning only works if passing can't be the best move, which
+# fails in zugzwang; positions with only king and pawns left are skipped
+def has_non_pawn_material(board, color):
+    knight = 1 + KNIGHT + (6 if color == 'black' else 0) # knight to queen codes are consecutive
+    return any(board.piece_counts[knight:knight + 4])
+
+
+# pruning tried before any move is searched at a non-PV node that isn't in
+# check. returns a score to cut off with, or None to search normally
+def selective_cutoff(board, depth, alpha, beta, maximizing_player, tt, context, static_eval):
+    # reverse futility: so far above beta (below alpha) that a quiet move
+    # near the leaves can't bring it back
+    if context.futility and depth < len(FUTILITY_MARGINS) and static_eval is not None:
+        margin = FUTILITY_MARGINS[depth]
+        if maximizing_player and static_eval - margin >= beta:
+            context.reverse_futility_prunes += 1
+            return static_eval - margin
+        if not maximizing_player and static_eval + margin <= alpha:
+            context.reverse_futility_prunes += 1
+            return static_eval + margin
+
+    # null move: let the opponent move twice; if the position still fails
+    # high (low) with a reduced search, a real move would too
+    color = 'white' if maximizing_player else 'black'
+    if (context.null_move and depth >= NULL_MOVE_MIN_DEPTH and has_non_pawn_material(board, color)
+            and not (board.history and board.history[-1][0] is None)):
+        if maximizing_player and beta != float('inf'):
+            board.make_null_move()
+            score = alphabeta(board, depth - 1 - NULL_MOVE_REDUCTION, beta - 1, beta, False, tt, context)
+            board.unmake_move()
+            if score >= beta:
+                context.null_move_cutoffs += 1
+                return beta
+        elif not maximizing_player and alpha != float('-inf'):
+            board.make_null_move()
+            score = alphabeta(board, depth - 1 - NULL_MOVE_REDUCTION, alpha, alpha + 1, True, tt, context)
+            board.unmake_move()
+            if score <= alpha:
+                context.null_move_cutoffs += 1
+                return alpha
+    return None
+
+
+# plays and searches one move. quiet moves that don't give check may be
+# skipped when the node is futile, or searched one ply shallower with a null
+# window when they come late in the ordering (and re-searched at full depth
+# if they turn out better than expected). returns None for a pruned move
+def search_move(board, move, index, depth, alpha, beta, maximizing_player, tt, context, futile, in_check):
+    reducible = (context is not None and context.lmr and depth >= LMR_MIN_DEPTH and index >= LMR_FULL_MOVES
+                 and not in_check and alpha != float('-inf') and beta != float('inf'))
+    candidate = (futile or reducible) and index > 0 and not is_tactical(board, move)
+
+    board.make_move(*move)
+    if candidate and not board.is_in_check(board.turn):
+        if futile:
+            board.unmake_move()
+            context.futility_prunes += 1
+            return None
+
+        context.reductions += 1
+        if maximizing_player:
+            score = alphabeta(board, depth - 2, alpha, alpha + 1, False, tt, context)
+            improves = score > alpha
+        else:
+            score = alphabeta(board, depth - 2, beta - 1, beta, True, tt, context)
+            improves = score < beta
+        if not improves:
+            board.unmake_move()
+            return score
+        context.reduction_researches += 1
+
+    score = search_child(board, depth - 1, alpha, beta, not maximizing_player, tt, context, index == 0)
+    board.unmake_move()
+    return score
+
+
+# searches the position after a move. with principal variation search every
+# move after the first is only tested against the bound its parent could
+# improve (a null window), and searched again with the full window if it does
+def search_child(board, depth, alpha, beta, maximizing_player, tt, context, first):
+    if first or context is None or not context.pvs:
+        return alphabeta(board, depth, alpha, beta, maximizing_player, tt, context)
+
+    if maximizing_player:
+        # parent minimizes: can this move get below beta?
+        if beta == float('inf'):
+            return alphabeta(board, depth, alpha, beta, True, tt, context)
+        score = alphabeta(board, depth, beta - 1, beta, True, tt, context)
+    else:
+        # parent maximizes: can this move get above alpha?
+        if alpha == float('-inf'):
+            return alphabeta(board, depth, alpha, beta, False, tt, context)
+        score = alphabeta(board, depth, alpha, alpha + 1, False, tt, context)
+
+    if alpha < score < beta:
+        context.researches += 1
+        score = alphabeta(board, depth, alpha, beta, maximizing_player, tt, context)
+    return score
+
+
+# exact score of a node below the root from the endgame tables, or None
+def tablebase_score(board, context):
+    if context is None or context.tablebase is None or len(board.history) <= context.root_ply:
+        return None
+    score = context.tablebase.score(board)
+    if score is not None:
+        context.tablebase_hits += 1
+    return score
+
+
+def alphabeta(board, depth, alpha, beta, maximizing_player, tt=None, context=None):
+    if context is not None:
+        context.count_node()
     if depth == 0:
+        # leaves aren't checked for mate, the table still beats the evaluation
+        score = tablebase_score(board, context)
+        if score is not None:
+            return score
+        if context is not None and context.quiescence:
+            return quiescence(board, alpha, beta, maximizing_player, context)
+        if context is not None and context.stats is not None:
+            context.stats.leaf_evals += 1
         return evaluate_board(board)
-    
+
+    alpha_original, beta_original = alpha, beta
+    color = 'white' if maximizing_player else 'black'
+    moves = board.legal_moves(color)
+    if not moves:
+        return terminal_score(board, color, depth)
+    # probed after the terminal check, so a mate on the board keeps its mate score
+    score = tablebase_score(board, context)
+    if score is not None:
+        return score
+
+    hash_move = None
+    if tt is not None:
+        entry = tt.probe(board.hash)
+        stats = context.stats if context is not None else None
+        if stats is not None:
+            stats.tt_probes += 1
+            stats.tt_hits += entry is not None
+        if entry is not None:
+            _, entry_depth, entry_score, entry_bound, hash_move, _ = entry
+            entry_score = probed_score(entry_score, depth)
+            if entry_depth >= depth:
+                if entry_bound == LOWER_BOUND:
+                    alpha = max(alpha, entry_score)
+                elif entry_bound == UPPER_BOUND:
+                    beta = min(beta, entry_score)
+                if entry_bound == EXACT or beta <= alpha:
+                    if stats is not None:
+                        stats.tt_cutoffs += 1
+                    return entry_score
+
+    in_check = False
+    futile = False
+    if context is not None and context.selective:
+        in_check = board.is_in_check(color)
+        if not in_check:
+            static_eval = evaluate_board(board) if context.futility and depth < len(FUTILITY_MARGINS) else None
+            if beta - alpha == 1:
+                score = selective_cutoff(board, depth, alpha, beta, maximizing_player, tt, context, static_eval)
+                if score is not None:
+                    return score
+            # futility: too far below alpha (above beta) for a quiet move to matter
+            if static_eval is not None:
+                margin = FUTILITY_MARGINS[depth]
+                futile = static_eval + margin <= alpha if maximizing_player else static_eval - margin >= beta
+
+    if context is not None and context.orderer is not None:
+        moves = context.orderer.order(board, moves, hash_move, len(board.history) - context.root_ply)
+    elif hash_move in moves:
+        # search the stored best move first
+        moves.remove(hash_move)
+        moves.insert(0, hash_move)
+
+    best_move = None
     if maximizing_player:
         max_eval = float('-inf')
-        for piece, (row, col) in board.get_all_pieces('white'):
-            for move in piece.valid_moves(board.board, row, col):
-                new_board = copy.deepcopy(board)
-                if new_board.move_piece((row, col), move):
-                    evaluation = alphabeta(new_board, depth - 1, alpha, beta, False)
-                    max_eval = max(max_eval, evaluation)
-                    alpha = max(alpha, evaluation)
-                    if beta <= alpha:
-                        break
+        for index, move in enumerate(moves):
+            evaluation = search_move(board, move, index, depth, alpha, beta, True, tt, context, futile, in_check)
+            if evaluation is None:
+                continue
+            if evaluation > max_eval or best_move is None:
+                best_move = move
+            max_eval = max(max_eval, evaluation)
+            alpha = max(alpha, evaluation)
             if beta <= alpha:
+                if context is not None:
+                    context.record_cutoff(board, move, depth, index)
                 break
-        return max_eval
+        value = max_eval
     else:
         min_eval = float('inf')
-        for piece, (row, col) in board.get_all_pieces('black'):
-            for move in piece.valid_moves(board.board, row, col):
-                new_board = copy.deepcopy(board)
-                if new_board.move_piece((row, col), move):
-                    evaluation = alphabeta(new_board, depth - 1, alpha, beta, True)
-                    min_eval = min(min_eval, evaluation)
-                    beta = min(beta, evaluation)
-                    if beta <= alpha:
-                        break
+        for index, move in enumerate(moves):
+            evaluation = search_move(board, move, index, depth, alpha, beta, False, tt, context, futile, in_check)
+            if evaluation is None:
+                continue
+            if evaluation < min_eval or best_move is None:
+                best_move = move
+            min_eval = min(min_eval, evaluation)
+            beta = min(beta, evaluation)
             if beta <= alpha:
+                if context is not None:
+                    context.record_cutoff(board, move, depth, index)
                 break
-        return min_eval
+        value = min_eval
+
+    if tt is not None:
+        if value <= alpha_original:
+            bound = UPPER_BOUND
+        elif value >= beta_original:
+            bound = LOWER_BOUND
+        else:
+            bound = EXACT
+        tt.store(board.hash, depth, stored_score(value, depth), bound, best_move)
+    return value
 
 
 # the chess bot class
 class ChessBot:
-    def __init__(self, color, depth):
+    # workers > 1 splits the root moves over that many processes (parallel.py).
+    # stats turns on search statistics, see open_stats_log
+    def __init__(self, color, depth, workers=1, stats=False):
         self.color = color
         self.depth = depth
-    
-    def choose_move(self, board):
+        self.workers = workers
+        self.parallel = None
+        self.best_score = None
+        self.collect_stats, self.stats_log, self.owns_stats_log = open_stats_log(stats)
+        self.stats = None # SearchStats of the last serial search
+
+    # search_moves limits the search to some of the root moves
+    def choose_move(self, board, search_moves=None):
+        moves = search_moves or board.legal_moves(self.color)
+        if self.workers > 1 and len(moves) > 1:
+            return self.choose_move_parallel(board, moves)
+
         best_move = None
         best_score = float('-inf') if self.color == 'white' else float('inf')
+        stats = SearchStats(board.to_fen(), self.color) if self.collect_stats else None
         
-        for piece, (row, col) in board.get_all_pieces(self.color):
-            for move in piece.valid_moves(board.board, row, col):
-                new_board = copy.deepcopy(board)
-                if new_board.move_piece((row, col), move):
-                    score = minimax(new_board, self.depth - 1, self.color == 'black')
-                    if (self.color == 'white' and score > best_score) or (self.color == 'black' and score < best_score):
-                        best_score = score
-                        best_move = ((row, col), move)
+        for start, end in moves:
+            board.make_move(start, end)
+            score = minimax(board, self.depth - 1, self.color == 'black', stats)
+            board.unmake_move()
+            if (self.color == 'white' and score > best_score) or (self.color == 'black' and score < best_score):
+                best_score = score
+                best_move = (start, end)
+        self.best_score = best_score
+
+        self.stats = None
+        if stats is not None and best_move is not None:
+            stats.nodes += 1 # the root
+            stats.record_iteration(self.depth, stats.nodes, best_move, best_score)
+            stats.finish(stats.nodes, best_move, best_score)
+            self.stats = stats
+            if self.stats_log is not None:
+                write_stats(self.stats_log, stats)
         return best_move
 
+    def choose_move_parallel(self, board, moves):
+        if self.parallel is None:
+            from parallel import ParallelRootSearch
+            self.parallel = ParallelRootSearch(self.workers)
+        move, self.best_score, _, _ = self.parallel.search(self, board, moves, {})
+        return move
+
+    # constructor arguments of a serial copy of this bot, for worker processes
+    def worker_arguments(self):
+        return dict(depth=self.depth)
+
+    # stops the worker processes of a parallel bot and closes the stats log
+    def close(self):
+        if self.parallel is not None:
+            self.parallel.close()
+            self.parallel = None
+        if self.owns_stats_log:
+            self.stats_log.close()
+            self.owns_stats_log = False
+        self.stats_log = None
+
+
+# the expected line of play: the best move followed by the hash moves stored
+# for the positions it leads to, as long as they are legal
+def principal_variation(board, tt, best_move, length):
+    line = [best_move]
+    board.make_move(*best_move)
+    while len(line) < length:
+        entry = tt.probe(board.hash)
+        if entry is None or entry[4] is None or entry[4] not in board.legal_moves(underpromotions=True):
+            break
+        line.append(entry[4])
+        board.make_move(*entry[4])
+    for _ in line:
+        board.unmake_move()
+    return line
+
+
+# deepest iteration a timed search may reach
+MAX_SEARCH_DEPTH = 64
+# a clock is spread over this many more moves when no fixed move time is set
+MOVES_TO_GO = 30
+# first aspiration window is the previous iteration's score +- this; it is
+# doubled on every fail until it passes ASPIRATION_LIMIT and goes unbounded
+ASPIRATION_WINDOW = 50
+ASPIRATION_LIMIT = 800
+
 
 class ImprovedChessBot:
-    def __init__(self, color, depth):
+    # depth is the fixed search depth; with move_time (seconds per move) or a
+    # clock passed to choose_move the bot deepens until the time is used up.
+    # book is an OpeningBook or the path of one (opening_book.py), played
+    # from before searching; book_selection is 'weighted' or 'best'.
+    # tablebase is a Tablebase or its directory (tablebase.py)
+    def __init__(self, color, depth, tt_size=1 << 16, move_time=None, quiescence=True,
+                 pvs=True, aspiration=True, null_move=True, lmr=True, futility=True, workers=1,
+                 book=None, book_selection='weighted', tablebase=None, stats=False, node_limit=None):
         self.color = color
         self.depth = depth
-    
-    def choose_move(self, board):
+        self.workers = workers
+        self.parallel = None
+        if isinstance(book, str):
+            from opening_book import OpeningBook
+            book = OpeningBook(book)
+        self.book = book
+        self.book_selection = book_selection
+        if isinstance(tablebase, str):
+            from tablebase import Tablebase
+            tablebase = Tablebase(tablebase)
+        self.tablebase = tablebase
+        self.move_time = move_time
+        self.node_limit = node_limit # nodes per search (per process when parallel), like move_time
+        self.quiescence = quiescence
+        self.pvs = pvs
+        self.aspiration = aspiration
+        self.null_move = null_move
+        self.lmr = lmr
+        self.futility = futility
+        self.stop = None # threading.Event to end a search from another thread
+        self.deadline = None # perf_counter time that ends the search, may be set while it runs (uci ponderhit)
+        self.on_iteration = None # called as on_iteration(bot, board, depth, move, score) after every finished depth
+        self.tt = TranspositionTable(tt_size) # kept between moves so earlier work is reused
+        self.orderer = MoveOrderer()
+        self.completed_depth = 0
+        self.best_score = None
+        self.context = None # SearchContext of the last search, for its statistics
+        self.collect_stats, self.stats_log, self.owns_stats_log = open_stats_log(stats)
+        self.stats = None # SearchStats of the last serial search, see open_stats_log
+
+    # seconds to spend on this move, or None for a depth-limited search.
+    # moves_to_go is the number of moves until the next time control
+    def time_budget(self, time_left=None, increment=0, moves_to_go=None):
+        if time_left is not None:
+            budget = time_left / (moves_to_go or MOVES_TO_GO) + increment * 0.75
+            return min(budget, time_left * 0.5)
+        return self.move_time
+
+    # constructor arguments of a serial copy of this bot, for worker processes
+    def worker_arguments(self):
+        return dict(depth=self.depth, tt_size=self.tt.size, move_time=self.move_time,
+                    quiescence=self.quiescence, pvs=self.pvs, aspiration=self.aspiration,
+                    null_move=self.null_move, lmr=self.lmr, futility=self.futility,
+                    tablebase=self.tablebase.directory if self.tablebase else None, node_limit=self.node_limit)
+
+    # stops the worker processes of a parallel bot and closes the stats log
+    def close(self):
+        if self.parallel is not None:
+            self.parallel.close()
+            self.parallel = None
+        if self.owns_stats_log:
+            self.stats_log.close()
+            self.owns_stats_log = False
+        self.stats_log = None
+
+    # iterative deepening: depth 1, 2, 3... each iteration starts with the
+    # previous best move; when time runs out the unfinished iteration is
+    # thrown away and the board is unwound to the root. search_moves limits
+    # the search to some of the root moves, depth_limit caps the depth of a
+    # timed search
+    def choose_move(self, board, time_left=None, increment=0, search_moves=None, moves_to_go=None,
+                    depth_limit=None):
+        if self.book is not None and not search_moves:
+            move = self.book.choose(board, self.book_selection)
+            if move is not None:
+                self.completed_depth = 0
+                self.best_score = None
+                self.stats = None
+                return move
+
+        if self.workers > 1:
+            self.stats = None
+            return self.choose_move_parallel(board, time_left, increment, search_moves, moves_to_go, depth_limit)
+
+        budget = self.time_budget(time_left, increment, moves_to_go)
+        start_time = time.perf_counter()
+        root_length = len(board.history)
+        context = SearchContext(None if budget is None else start_time + budget, self.orderer, root_length,
+                                self.quiescence, self.pvs, self.null_move, self.lmr, self.futility,
+                                self.tablebase, self.stop,
+                                SearchStats(board.to_fen(), self.color) if self.collect_stats else None,
+                                self.node_limit)
+        self.context = context
+        # read after the context is published, so a deadline set meanwhile isn't lost
+        if self.deadline is not None:
+            context.deadline = self.deadline if context.deadline is None else min(context.deadline, self.deadline)
+        self.stats = None
+        if budget is None and self.node_limit is None:
+            max_depth = self.depth
+        else:
+            max_depth = min(depth_limit or MAX_SEARCH_DEPTH, MAX_SEARCH_DEPTH)
+        self.tt.new_search()
+        self.orderer.new_search()
+        self.completed_depth = 0
+        self.best_score = None
+
+        moves = list(search_moves) if search_moves else board.legal_moves(self.color)
+        if not moves:
+            return None
+        entry = self.tt.probe(board.hash)
+        moves = self.orderer.order(board, moves, entry[4] if entry else None)
+
+        best_move = moves[0]
+        for depth in range(1, max_depth + 1):
+            try:
+                if self.aspiration and self.best_score is not None and abs(self.best_score) < MATE_SCORE:
+                    move, score = self.search_aspiration(board, moves, depth, context, self.best_score)
+                else:
+                    move, score = self.search_root(board, moves, depth, context)
+            except SearchTimeout:
+                while len(board.history) > root_length:
+                    board.unmake_move()
+                break
+
+            best_move = move
+            self.completed_depth = depth
+            self.best_score = score
+            moves.remove(move)
+            moves.insert(0, move)
+            if context.stats is not None:
+                context.stats.record_iteration(depth, context.nodes, move, score)
+            if self.on_iteration is not None:
+                self.on_iteration(self, board, depth, move, score)
+
+            # a forced mate won't change with more depth. it is scored as the
+            # full depth search would score it, with that much more depth left
+            # at the mated node, so results of different searches compare
+            if abs(score) >= MATE_SCORE:
+                self.best_score = score + (max_depth - depth) * (1 if score > 0 else -1)
+                break
+            # the next iteration takes several times longer, don't start what can't finish
+            if budget is not None and time.perf_counter() - start_time > budget * 0.5:
+                break
+
+        if context.stats is not None:
+            context.stats.finish(context.nodes, best_move, self.best_score, context)
+            self.stats = context.stats
+            if self.stats_log is not None:
+                write_stats(self.stats_log, context.stats)
+        return best_move
+
+    # the root moves are ordered here as the serial search would order them,
+    # so ties between workers go to the move the serial search tries first
+    def choose_move_parallel(self, board, time_left=None, increment=0, search_moves=None, moves_to_go=None,
+                             depth_limit=None):
+        moves = list(search_moves) if search_moves else board.legal_moves(self.color)
+        if not moves:
+            return None
+        entry = self.tt.probe(board.hash)
+        moves = self.orderer.order(board, moves, entry[4] if entry else None)
+
+        if self.parallel is None:
+            from parallel import ParallelRootSearch
+            self.parallel = ParallelRootSearch(self.workers)
+        clock = dict(time_left=time_left, increment=increment, moves_to_go=moves_to_go, depth_limit=depth_limit)
+        # only the node count of the workers is kept, updated as they report depths
+        self.context = SearchContext()
+        move, self.best_score, nodes, self.completed_depth = self.parallel.search(self, board, moves, clock)
+        self.context.nodes = nodes
+        return move
+
+    # searches a narrow window around the previous score; a result outside it
+    # is only a bound, so the window is widened on that side and searched again
+    def search_aspiration(self, board, moves, depth, context, previous_score):
+        delta = ASPIRATION_WINDOW
+        alpha = previous_score - delta
+        beta = previous_score + delta
+        while True:
+            move, score = self.search_root(board, moves, depth, context, alpha, beta)
+            if alpha < score < beta:
+                return move, score
+            delta *= 2
+            if score <= alpha:
+                alpha = previous_score - delta if delta <= ASPIRATION_LIMIT else float('-inf')
+            else:
+                beta = previous_score + delta if delta <= ASPIRATION_LIMIT else float('inf')
+
+    def search_root(self, board, moves, depth, context, alpha=float('-inf'), beta=float('inf')):
+        alpha_original, beta_original = alpha, beta
         best_move = None
         best_score = float('-inf') if self.color == 'white' else float('inf')
-        alpha = float('-inf')
-        beta = float('inf')
-        
-        for piece, (row, col) in board.get_all_pieces(self.color):
-            for move in piece.valid_moves(board.board, row, col):
-                new_board = copy.deepcopy(board)
-                if new_board.move_piece((row, col), move):
-                    score = alphabeta(new_board, self.depth - 1, alpha, beta, self.color == 'black')
-                    
-                    if self.color == 'white':
-                        if score > best_score:
-                            best_score = score
-                            best_move = ((row, col), move)
-                        alpha = max(alpha, score)
-                    else:
-                        if score < best_score:
-                            best_score = score
-                            best_move = ((row, col), move)
-                        beta = min(beta, score)
-                    
-                    if beta <= alpha:
-                        break
+
+        for index, move in enumerate(moves):
+            board.make_move(*move)
+            score = search_child(board, depth - 1, alpha, beta, self.color == 'black', self.tt, context, index == 0)
+            board.unmake_move()
+
+            if self.color == 'white':
+                if score > best_score or best_move is None:
+                    best_score = score
+                    best_move = move
+                alpha = max(alpha, score)
+            else:
+                if score < best_score or best_move is None:
+                    best_score = score
+                    best_move = move
+                beta = min(beta, score)
+
             if beta <= alpha:
                 break
-                
-        return best_move
+
+        if alpha_original < best_score < beta_original:
+            self.tt.store(board.hash, depth, stored_score(best_score, depth), EXACT, best_move)
+        return best_move, best_score
 
 
 # P v P game loop
@@ -629,18 +2268,23 @@ def play_chess_with_ai():
             start, end = move.split()
             start = (int(start[1]) - 1, ord(start[0]) - ord('a'))
             end = (int(end[1]) - 1, ord(end[0]) - ord('a'))
+            promotion = None
         else:
-            start, end = bot_player.choose_move(board)
-            print(f"Bot's move: {chr(start[1] + ord('a'))}{start[0] + 1} {chr(end[1] + ord('a'))}{end[0] + 1}")
-
-        if board.move_piece(start, end):
+            # book moves may be underpromotions: (start, end, piece type)
+            move = bot_player.choose_move(board)
+            start, end = move[0], move[1]
+            promotion = move[2] if len(move) > 2 else None
+            print(f"Bot's move: {chr(start[1] + ord('a'))}{start[0] + 1} {chr(end[1] + ord('a'))}{end[0] + 1}"
+                  + (str(promotion('black')) if promotion else ''))
+
+        if board.move_piece(start, end, promotion):
             current_player = 'black' if current_player == 'white' else 'white'
         else:
             print("Invalid move. Try again.")
 
-def play_chess_with_improved_ai():
-    board = ChessBoard()
-    bot_player = ImprovedChessBot('black', depth=4)  # Increased depth due to better pruning
+def play_chess_with_improved_ai(board_class=ChessBoard, move_time=None):
+    board = board_class()
+    bot_player = ImprovedChessBot('black', depth=4, move_time=move_time)  # Increased depth due to better pruning
     current_player = 'white'
 
     while True:
@@ -661,12 +2305,17 @@ def play_chess_with_improved_ai():
             start, end = move.split()
             start = (int(start[1]) - 1, ord(start[0]) - ord('a'))
             end = (int(end[1]) - 1, ord(end[0]) - ord('a'))
+            promotion = None
         else:
             print("Bot is thinking...")
-            start, end = bot_player.choose_move(board)
-            print(f"Bot's move: {chr(start[1] + ord('a'))}{start[0] + 1} {chr(end[1] + ord('a'))}{end[0] + 1}")
-
-        if board.move_piece(start, end):
+            # book moves may be underpromotions: (start, end, piece type)
+            move = bot_player.choose_move(board)
+            start, end = move[0], move[1]
+            promotion = move[2] if len(move) > 2 else None
+            print(f"Bot's move: {chr(start[1] + ord('a'))}{start[0] + 1} {chr(end[1] + ord('a'))}{end[0] + 1}"
+                  + (str(promotion('black')) if promotion else ''))
+
+        if board.move_piece(start, end, promotion):
             current_player = 'black' if current_player == 'white' else 'white'
         else:
             print("Invalid move. Try again.")
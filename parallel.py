@@ -0,0 +1,142 @@
+# parallel root search for ChessBot and ImprovedChessBot: the root moves are
+# dealt out round-robin to a pool of worker processes, each running the
+# ordinary serial search of a fresh copy of the bot on its share. boards are
+# sent as FEN strings rather than pickled ChessBoard objects, and the workers
+# share nothing (no common hash table), so the merged result only depends on
+# the position and the settings, never on which worker finishes first
+#
+#   bot = ImprovedChessBot('white', 5, workers=8)
+#   move = bot.choose_move(board)
+#   bot.close()
+#
+# the workers share a stop event with the parent, set when the bot's stop
+# event is set or its deadline passes, and report every finished depth on a
+# queue, so a parallel search can be stopped and reported on like a serial one
+import multiprocessing
+import os
+import queue
+import time
+from concurrent.futures import ProcessPoolExecutor, wait
+
+# seconds between checks of the stop event and the progress queue
+POLL_INTERVAL = 0.005
+
+# set in every worker process by start_worker
+worker_stop = None
+worker_progress = None
+
+
+def default_workers():
+    return os.cpu_count() or 1
+
+
+def start_worker(stop, progress):
+    global worker_stop, worker_progress
+    worker_stop = stop
+    worker_progress = progress
+
+
+# runs in a worker process: rebuilds the board and the bot and searches the
+# given root moves. returns (best move, score, nodes, completed depth). with
+# report set every finished depth is put on the progress queue as
+# (search, share, depth, move, score, nodes)
+def search_share(board_class, fen, bot_class, color, arguments, moves, clock, search=0, share=0, report=False):
+    board = board_class.from_fen(fen)
+    bot = bot_class(color, **arguments)
+    if hasattr(bot, 'on_iteration'):
+        bot.stop = worker_stop
+        if report:
+            bot.on_iteration = lambda bot, board, depth, move, score: worker_progress.put(
+                (search, share, depth, move, score, bot.context.nodes))
+    move = bot.choose_move(board, search_moves=moves, **clock)
+    context = getattr(bot, 'context', None)
+    nodes = context.nodes if context is not None else 0
+    depth = getattr(bot, 'completed_depth', bot.depth)
+    return move, bot.best_score, nodes, depth
+
+
+# best score for the side to move among (move, score) pairs; equal scores go
+# to the move that comes first in the root ordering
+def merge(white, moves, results):
+    best_move, best_score = None, None
+    for move, score in results:
+        if move is None:
+            continue
+        better = best_score is None or (score > best_score if white else score < best_score)
+        tied = score == best_score and moves.index(move) < moves.index(best_move)
+        if better or tied:
+            best_move, best_score = move, score
+    return best_move, best_score
+
+
+class ParallelRootSearch:
+    def __init__(self, workers=None):
+        self.workers = workers or default_workers()
+        self.pool = None # started on the first search and kept for the next ones
+        self.stop = None
+        self.progress = None
+        self.searches = 0 # numbers the searches, so late reports of an old one are dropped
+
+    # moves are the root moves in the order the serial search would try them;
+    # clock holds the keyword arguments for the workers' choose_move
+    def search(self, bot, board, moves, clock):
+        if self.pool is None:
+            # spawned, not forked: a fork while another thread holds a lock
+            # (uci.py reading stdin) can leave the worker stuck on it
+            context = multiprocessing.get_context('spawn')
+            self.stop = context.Event()
+            self.progress = context.Queue()
+            self.pool = ProcessPoolExecutor(self.workers, context, start_worker, (self.stop, self.progress))
+        self.stop.clear()
+        self.searches += 1
+
+        fen = board.to_fen()
+        arguments = bot.worker_arguments()
+        report = getattr(bot, 'on_iteration', None) is not None
+        shares = [share for share in (moves[i::self.workers] for i in range(self.workers)) if share]
+        futures = [self.pool.submit(search_share, type(board), fen, type(bot), bot.color, arguments, share, clock,
+                                    self.searches, index, report)
+                   for index, share in enumerate(shares)]
+
+        # (move, score, nodes) of every share at every depth it finished
+        finished = [{} for _ in shares]
+        reported = 0
+        pending = set(futures)
+        while pending:
+            _, pending = wait(pending, timeout=POLL_INTERVAL)
+            stop = getattr(bot, 'stop', None)
+            deadline = getattr(bot, 'deadline', None)
+            if (stop is not None and stop.is_set()) or (deadline is not None and time.perf_counter() >= deadline):
+                self.stop.set()
+            if report:
+                reported = self.report(bot, board, moves, finished, reported)
+        results = [future.result() for future in futures]
+
+        move, score = merge(bot.color == 'white', moves, [(move, score) for move, score, _, _ in results])
+        nodes = sum(result[2] for result in results)
+        # a timed search is only as deep as its shallowest worker
+        depth = min(result[3] for result in results)
+        return move, score, nodes, depth
+
+    # passes every depth that all shares have finished to bot.on_iteration,
+    # with the moves merged like the final result
+    def report(self, bot, board, moves, finished, reported):
+        while True:
+            try:
+                search, share, depth, move, score, nodes = self.progress.get_nowait()
+            except queue.Empty:
+                break
+            if search == self.searches:
+                finished[share][depth] = (move, score, nodes)
+        while all(reported + 1 in depths for depths in finished):
+            reported += 1
+            results = [depths[reported] for depths in finished]
+            move, score = merge(bot.color == 'white', moves, [(move, score) for move, score, _ in results])
+            bot.context.nodes = sum(max(entry[2] for entry in depths.values()) for depths in finished)
+            bot.on_iteration(bot, board, reported, move, score)
+        return reported
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
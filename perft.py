@@ -0,0 +1,170 @@
+# perft: counts the leaf nodes of the legal move tree to a fixed depth. the
+# counts are compared against published numbers to catch move generation
+# bugs, and the timing gives nodes per second for backend comparisons
+#
+#   python perft.py --suite                    # all reference positions
+#   python perft.py --depth 4                  # start position
+#   python perft.py --fen "<fen>" --depth 3 --divide
+#   python perft.py --suite --backend bitboard
+#   python perft.py --suite --verify --depth 2  # cross-check the fast paths
+#
+# --verify walks the same trees and checks at every node that is_in_check
+# agrees with is_in_check_reference for both colors, and evaluate_board
+# (incremental) with evaluate_board_full
+import argparse
+import sys
+import time
+
+from main2 import ChessBoard, STARTING_FEN, evaluate_board, evaluate_board_full, move_to_uci
+
+# mismatching positions printed per run of --verify
+MAX_REPORTED = 5
+
+# (name, fen, leaf counts for depth 1, 2, 3, ...)
+REFERENCE_POSITIONS = [
+    ("startpos", STARTING_FEN,
+     [20, 400, 8902, 197281, 4865609]),
+    ("kiwipete", "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+     [48, 2039, 97862, 4085603]),
+    ("position3", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+     [14, 191, 2812, 43238, 674624]),
+    ("position4", "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+     [6, 264, 9467, 422333]),
+    ("position5", "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+     [44, 1486, 62379, 2103487]),
+    ("position6", "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+     [46, 2079, 89890, 3894594]),
+]
+
+
+def board_class(backend):
+    if backend == 'bitboard':
+        from bitboard import BitboardChessBoard
+        return BitboardChessBoard
+    return ChessBoard
+
+
+def perft(board, depth):
+    if depth == 0:
+        return 1
+    moves = board.legal_moves(underpromotions=True)
+    # the moves of the last ply are leaves, no need to play them
+    if depth == 1:
+        return len(moves)
+    nodes = 0
+    for move in moves:
+        board.make_move(*move)
+        nodes += perft(board, depth - 1)
+        board.unmake_move()
+    return nodes
+
+
+# perft split by root move, to narrow a wrong count down to one move
+def divide(board, depth):
+    counts = []
+    for move in board.legal_moves(underpromotions=True):
+        board.make_move(*move)
+        counts.append((move, perft(board, depth - 1)))
+        board.unmake_move()
+    return counts
+
+
+# nodes visited and the (fen, what) of every node where a fast path and its
+# reference implementation disagree
+def verify(board, depth):
+    mismatches = []
+    for color in ('white', 'black'):
+        if board.is_in_check(color) != board.is_in_check_reference(color):
+            mismatches.append((board.to_fen(), f"is_in_check({color!r})"))
+    if evaluate_board(board) != evaluate_board_full(board):
+        mismatches.append((board.to_fen(), "evaluate_board"))
+    nodes = 1
+    if depth > 0:
+        for move in board.legal_moves(underpromotions=True):
+            board.make_move(*move)
+            child_nodes, child_mismatches = verify(board, depth - 1)
+            board.unmake_move()
+            nodes += child_nodes
+            mismatches += child_mismatches
+    return nodes, mismatches
+
+
+def run_verify(cls, positions, depth):
+    failures = 0
+    for name, fen in positions:
+        start = time.perf_counter()
+        nodes, mismatches = verify(cls.from_fen(fen), depth)
+        elapsed = time.perf_counter() - start
+        status = "ok" if not mismatches else f"FAIL ({len(mismatches)} mismatches)"
+        print(f"{name:10} depth {depth}: {nodes:>9} nodes checked {elapsed:8.3f}s  {status}")
+        for mismatch_fen, what in mismatches[:MAX_REPORTED]:
+            print(f"  {what} differs in {mismatch_fen}")
+        failures += len(mismatches)
+    print(f"{failures} mismatches")
+    return failures
+
+
+def _timed_perft(board, depth):
+    start = time.perf_counter()
+    nodes = perft(board, depth)
+    elapsed = time.perf_counter() - start
+    return nodes, elapsed
+
+
+def _nps(nodes, elapsed):
+    return int(nodes / elapsed) if elapsed > 0 else 0
+
+
+def run_suite(cls, max_depth):
+    failures = 0
+    total_nodes = 0
+    total_time = 0.0
+    for name, fen, counts in REFERENCE_POSITIONS:
+        for depth, expected in enumerate(counts[:max_depth], 1):
+            nodes, elapsed = _timed_perft(cls.from_fen(fen), depth)
+            total_nodes += nodes
+            total_time += elapsed
+            status = "ok" if nodes == expected else f"FAIL (expected {expected})"
+            if nodes != expected:
+                failures += 1
+            print(f"{name:10} depth {depth}: {nodes:>9} nodes {elapsed:8.3f}s {_nps(nodes, elapsed):>8} nps  {status}")
+    print(f"total: {total_nodes} nodes in {total_time:.3f}s, {_nps(total_nodes, total_time)} nps, {failures} failures")
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Perft move generation benchmark and validation")
+    parser.add_argument("--fen", default=STARTING_FEN, help="position to search (default: start position)")
+    parser.add_argument("--depth", type=int, default=3, help="search depth (suite: maximum depth)")
+    parser.add_argument("--divide", action="store_true", help="print the node count of every root move")
+    parser.add_argument("--suite", action="store_true", help="run the bundled reference positions")
+    parser.add_argument("--backend", choices=["mailbox", "bitboard"], default="mailbox")
+    parser.add_argument("--verify", action="store_true",
+                        help="check is_in_check and evaluate_board against their reference versions instead")
+    args = parser.parse_args(argv)
+
+    cls = board_class(args.backend)
+    if args.verify:
+        positions = [(name, fen) for name, fen, _ in REFERENCE_POSITIONS] if args.suite else [("position", args.fen)]
+        return 1 if run_verify(cls, positions, args.depth) else 0
+    if args.suite:
+        return 1 if run_suite(cls, args.depth) else 0
+
+    board = cls.from_fen(args.fen)
+    start = time.perf_counter()
+    if args.divide:
+        counts = divide(board, args.depth)
+        for move, nodes in sorted(counts, key=lambda item: move_to_uci(item[0])):
+            print(f"{move_to_uci(move)}: {nodes}")
+        nodes = sum(nodes for _, nodes in counts)
+        print(f"moves: {len(counts)}")
+    else:
+        nodes = perft(board, args.depth)
+    elapsed = time.perf_counter() - start
+    print(f"nodes: {nodes}")
+    print(f"time: {elapsed:.3f}s ({_nps(nodes, elapsed)} nps)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
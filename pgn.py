@@ -0,0 +1,232 @@
+# PGN support: standard algebraic notation for moves and PGN text for games,
+# and a streaming reader for PGN files
+#
+#   for headers, sans in read_games('games.pgn.gz'):
+#       board, moves = resolve_game(headers, sans)
+import gzip
+import re
+import time
+
+from main2 import (ChessBoard, FEN_PIECES, FEN_SYMBOLS, STARTING_FEN, Pawn, King, Queen,
+                   parse_square, square_name)
+
+# longest movetext line written
+LINE_LENGTH = 80
+
+RESULTS = ('1-0', '0-1', '1/2-1/2', '*')
+TAG_PATTERN = re.compile(r'\[\s*(\w+)\s+"((?:[^"\\]|\\.)*)"\s*\]')
+TOKEN_PATTERN = re.compile(r'[{};()]|[^\s{};()]+')
+MOVE_NUMBER_PATTERN = re.compile(r'^\d+\.*')
+SAN_PATTERN = re.compile(r'^([NBRQK])?([a-h])?([1-8])?x?([a-h][1-8])(?:=?([NBRQ]))?$')
+
+
+# SAN of a legal move in the position, e.g. 'Nbd7', 'exd6', 'e8=Q+', 'O-O#'
+def move_to_san(board, move):
+    (row, col), (end_row, end_col) = move[0], move[1]
+    piece = board.board[row][col]
+    if isinstance(piece, King) and abs(end_col - col) == 2:
+        san = 'O-O' if end_col > col else 'O-O-O'
+    elif isinstance(piece, Pawn):
+        # a pawn changing files captures, en passant included
+        san = square_name(move[1]) if col == end_col else f"{square_name(move[0])[0]}x{square_name(move[1])}"
+        if end_row in (0, 7):
+            promoted = move[2] if len(move) > 2 and move[2] is not None else Queen
+            san += '=' + FEN_SYMBOLS[promoted].upper()
+    else:
+        san = FEN_SYMBOLS[type(piece)].upper()
+        # other pieces of the same kind that could go to the same square
+        rivals = [start for start, end, *_ in board.legal_moves(piece.color)
+                  if end == move[1] and start != move[0] and type(board.board[start[0]][start[1]]) is type(piece)]
+        if rivals:
+            if all(start[1] != col for start in rivals):
+                san += square_name(move[0])[0]
+            elif all(start[0] != row for start in rivals):
+                san += square_name(move[0])[1]
+            else:
+                san += square_name(move[0])
+        if board.board[end_row][end_col] is not None:
+            san += 'x'
+        san += square_name(move[1])
+
+    board.make_move(*move)
+    if board.is_in_check(board.turn):
+        san += '+' if board.has_legal_move(board.turn) else '#'
+    board.unmake_move()
+    return san
+
+
+# movetext with move numbers counted from first_number (the fullmove number
+# of the starting position), wrapped at LINE_LENGTH
+def format_movetext(sans, result, white_first=True, first_number=1):
+    tokens = []
+    number = first_number
+    if not white_first and sans:
+        tokens.append(f"{number}... {sans[0]}")
+        sans = sans[1:]
+        number += 1
+    for i, san in enumerate(sans):
+        tokens.append(f"{number}. {san}" if i % 2 == 0 else san)
+        if i % 2 == 1:
+            number += 1
+    tokens.append(result)
+
+    lines = []
+    line = ''
+    for token in tokens:
+        if line and len(line) + 1 + len(token) > LINE_LENGTH:
+            lines.append(line)
+            line = token
+        else:
+            line = f"{line} {token}" if line else token
+    lines.append(line)
+    return '\n'.join(lines)
+
+
+def escape_tag(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"')
+
+
+# PGN text of one game; extra headers follow the seven tag roster
+def game_to_pgn(white, black, result, sans, fen=STARTING_FEN, event='?', round_number='?', headers=None):
+    tags = [
+        ('Event', event),
+        ('Site', '?'),
+        ('Date', time.strftime('%Y.%m.%d')),
+        ('Round', str(round_number)),
+        ('White', white),
+        ('Black', black),
+        ('Result', result),
+    ]
+    if fen != STARTING_FEN:
+        tags += [('SetUp', '1'), ('FEN', fen)]
+    tags += list((headers or {}).items())
+    tags.append(('PlyCount', str(len(sans))))
+    header = '\n'.join(f'[{name} "{escape_tag(value)}"]' for name, value in tags)
+    start = ChessBoard.from_fen(fen)
+    return f"{header}\n\n{format_movetext(sans, result, start.turn == 'white', start.fullmove_number)}\n"
+
+
+# the legal move written in SAN. check marks and annotations are optional,
+# a promotion without a piece letter is a queen promotion
+def parse_san(board, text):
+    san = text.rstrip('+#!?')
+    moves = board.legal_moves(board.turn, underpromotions=True)
+    if san in ('O-O', 'O-O-O', '0-0', '0-0-0'):
+        kingside = len(san) == 3
+        for move in moves:
+            (row, col), (_, end_col) = move[0], move[1]
+            if isinstance(board.board[row][col], King) and end_col - col == (2 if kingside else -2):
+                return move
+        raise ValueError(f"illegal move: {text!r}")
+
+    match = SAN_PATTERN.match(san)
+    if not match:
+        raise ValueError(f"invalid SAN move: {text!r}")
+    letter, file, rank, target, promotion = match.groups()
+    piece_type = FEN_PIECES[letter.lower()] if letter else Pawn
+    end = parse_square(target)
+    promoted = FEN_PIECES[promotion.lower()] if promotion else Queen
+
+    candidates = []
+    for move in moves:
+        (row, col) = move[0]
+        if move[1] != end or type(board.board[row][col]) is not piece_type:
+            continue
+        if (file and col != ord(file) - ord('a')) or (rank and row != int(rank) - 1):
+            continue
+        if piece_type is Pawn and end[0] in (0, 7):
+            if (move[2] if len(move) > 2 and move[2] is not None else Queen) is not promoted:
+                continue
+        candidates.append(move)
+    if len(candidates) != 1:
+        raise ValueError(f"{'ambiguous' if candidates else 'illegal'} move: {text!r}")
+    return candidates[0]
+
+
+# text file or gzip file (by its .gz suffix) of PGN games
+def open_pgn(path):
+    if str(path).endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8-sig', errors='replace')
+    return open(path, encoding='utf-8-sig', errors='replace')
+
+
+def read_games(path):
+    with open_pgn(path) as f:
+        yield from parse_games(f)
+
+
+# yields (headers, SAN moves) of every game in an iterable of PGN lines, one
+# game at a time. comments, variations and NAGs are skipped; the result token
+# fills in a missing Result tag
+def parse_games(lines):
+    headers = {}
+    sans = []
+    in_comment = False
+    variation_depth = 0
+    for line in lines:
+        position = 0
+        if in_comment:
+            position = line.find('}') + 1
+            if not position:
+                continue
+            in_comment = False
+        elif line.startswith('%'):
+            continue
+        elif line.startswith('[') and not variation_depth:
+            # malformed tags are skipped
+            match = TAG_PATTERN.match(line)
+            if match:
+                if sans:
+                    # a game without a result token
+                    yield headers, sans
+                    headers, sans = {}, []
+                headers[match.group(1)] = re.sub(r'\\(.)', r'\1', match.group(2))
+            continue
+
+        while True:
+            match = TOKEN_PATTERN.search(line, position)
+            if not match:
+                break
+            token = match.group()
+            position = match.end()
+            if token == '{':
+                position = line.find('}', position) + 1
+                if not position:
+                    in_comment = True
+                    break
+            elif token == ';':
+                break
+            elif token == '(':
+                variation_depth += 1
+            elif token == ')':
+                variation_depth = max(variation_depth - 1, 0)
+            elif variation_depth or token.startswith('$'):
+                continue
+            elif token in RESULTS:
+                headers.setdefault('Result', token)
+                yield headers, sans
+                headers, sans = {}, []
+            else:
+                token = MOVE_NUMBER_PATTERN.sub('', token)
+                if token.strip('!?'):
+                    sans.append(token)
+    if headers or sans:
+        yield headers, sans
+
+
+# board in the game's starting position and the game's moves resolved against
+# it. raises ValueError at the first move that isn't legal
+def resolve_game(headers, sans, board_class=ChessBoard):
+    board = board_class.from_fen(headers.get('FEN', STARTING_FEN))
+    moves = []
+    try:
+        for san in sans:
+            move = parse_san(board, san)
+            board.make_move(*move)
+            moves.append(move)
+    except ValueError as error:
+        raise ValueError(f"{error} at ply {len(moves) + 1}") from None
+    finally:
+        for _ in moves:
+            board.unmake_move()
+    return board, moves
@@ -0,0 +1,87 @@
+# position encoding benchmark: FEN and packed (ChessBoard.pack) encoding and
+# decoding throughput over positions sampled from random games
+#
+#   python position_bench.py --positions 20000
+#   python position_bench.py --backend bitboard --numpy
+#   python position_bench.py --output positions.bin
+import argparse
+import random
+import sys
+import time
+
+from main2 import PACKED_SIZE
+from perft import board_class
+
+
+# positions from random legal games, a few of every game
+def sample_positions(cls, count, seed=0):
+    rng = random.Random(seed)
+    boards = []
+    while len(boards) < count:
+        board = cls()
+        for _ in range(rng.randint(10, 120)):
+            moves = board.legal_moves(board.turn, underpromotions=True)
+            if not moves:
+                break
+            board.make_move(*rng.choice(moves))
+            if rng.random() < 0.1:
+                boards.append(cls.from_fen(board.to_fen()))
+    return boards[:count]
+
+
+def timed(function, items):
+    start = time.perf_counter()
+    results = [function(item) for item in items]
+    return results, time.perf_counter() - start
+
+
+def report(name, count, elapsed, size=None):
+    line = f"{name:<14} {count / elapsed:>10.0f} positions/s"
+    if size is not None:
+        line += f" {size:>7.1f} bytes/position"
+    print(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark FEN and packed position encoding")
+    parser.add_argument("--positions", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--backend", choices=["mailbox", "bitboard"], default="mailbox")
+    parser.add_argument("--numpy", action="store_true", help="also time batch_eval.unpack_codes (needs numpy)")
+    parser.add_argument("--output", help="write the packed positions to this file")
+    args = parser.parse_args(argv)
+
+    cls = board_class(args.backend)
+    boards = sample_positions(cls, args.positions, args.seed)
+    count = len(boards)
+
+    fens, elapsed = timed(lambda board: board.to_fen(), boards)
+    report("fen encode", count, elapsed, sum(len(fen) for fen in fens) / count)
+    decoded, elapsed = timed(cls.from_fen, fens)
+    report("fen decode", count, elapsed)
+
+    packed, elapsed = timed(lambda board: board.pack(), boards)
+    report("pack", count, elapsed, PACKED_SIZE)
+    unpacked, elapsed = timed(cls.unpack, packed)
+    report("unpack", count, elapsed)
+
+    mismatches = sum(board.to_fen() != fen for board, fen in zip(unpacked, fens))
+    mismatches += sum(board.to_fen() != fen for board, fen in zip(decoded, fens))
+
+    data = b''.join(packed)
+    if args.numpy:
+        from batch_eval import unpack_codes
+        start = time.perf_counter()
+        unpack_codes(data)
+        report("numpy unpack", count, time.perf_counter() - start)
+    if args.output:
+        with open(args.output, 'wb') as f:
+            f.write(data)
+        print(f"wrote {len(data)} bytes to {args.output}")
+
+    print(f"round trip mismatches: {mismatches}")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
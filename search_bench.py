@@ -0,0 +1,85 @@
+# search benchmark: runs ImprovedChessBot to a fixed depth over a set of
+# positions with search features switched on or off, and compares nodes,
+# time and the chosen moves of each configuration
+#
+#   python search_bench.py --depth 4
+#   python search_bench.py --depth 5 --config alphabeta --config pvs
+#   python search_bench.py --depth 4 --workers 8
+#   python search_bench.py --depth 5 --config selective --stats stats.jsonl
+import argparse
+import sys
+import time
+
+from main2 import ImprovedChessBot, move_to_uci
+from perft import board_class
+
+BENCH_POSITIONS = [
+    "rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq - 0 1",
+    "r1bqkbnr/pppp1ppp/2n5/4p3/4P3/5N2/PPPP1PPP/RNBQKB1R w KQkq - 2 3",
+    "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+    "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+    "r1bq1rk1/pp2bppp/2n1pn2/3p4/2PP4/2N1PN2/PP3PPP/R2QKB1R w KQ - 0 8",
+    "2r2rk1/pp3ppp/2n1pn2/q2p4/3P4/P1PBPN2/5PPP/R2QK2R w KQ - 0 14",
+    "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+    "6k1/5ppp/8/8/8/8/5PPP/3R2K1 w - - 0 1",
+]
+
+# ImprovedChessBot options of each named configuration
+NO_SELECTIVITY = dict(null_move=False, lmr=False, futility=False)
+CONFIGS = {
+    "alphabeta": dict(pvs=False, aspiration=False, **NO_SELECTIVITY),
+    "pvs": dict(pvs=True, aspiration=False, **NO_SELECTIVITY),
+    "pvs+aspiration": dict(pvs=True, aspiration=True, **NO_SELECTIVITY),
+    "null-move": dict(null_move=True, lmr=False, futility=False),
+    "lmr": dict(null_move=False, lmr=True, futility=False),
+    "futility": dict(null_move=False, lmr=False, futility=True),
+    "selective": dict(null_move=True, lmr=True, futility=True),
+}
+
+
+# stats is passed on to the bots: a path appends one JSON line of search
+# statistics per position
+def run_config(name, depth, cls, positions=BENCH_POSITIONS, workers=1, stats=False):
+    results = []
+    for fen in positions:
+        board = cls.from_fen(fen)
+        bot = ImprovedChessBot(board.turn, depth, workers=workers, stats=stats, **CONFIGS[name])
+        start = time.perf_counter()
+        move = bot.choose_move(board)
+        elapsed = time.perf_counter() - start
+        bot.close()
+        results.append((fen, move, bot.best_score, bot.context.nodes, elapsed))
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare search configurations on fixed positions")
+    parser.add_argument("--depth", type=int, default=4)
+    parser.add_argument("--config", action="append", choices=sorted(CONFIGS),
+                        help="configuration to run (repeatable, default: all)")
+    parser.add_argument("--backend", choices=["mailbox", "bitboard"], default="mailbox")
+    parser.add_argument("--workers", type=int, default=1, help="processes for the parallel root search")
+    parser.add_argument("--stats", help="append search statistics of every position to this file as JSON lines")
+    args = parser.parse_args(argv)
+
+    cls = board_class(args.backend)
+    summary = []
+    for name in args.config or list(CONFIGS):
+        print(f"== {name} (depth {args.depth})")
+        results = run_config(name, args.depth, cls, workers=args.workers, stats=args.stats or False)
+        for index, (fen, move, score, nodes, elapsed) in enumerate(results, 1):
+            print(f"{index:2} {move_to_uci(move) if move else '-':6} {score:>9} {nodes:>9} nodes {elapsed:7.2f}s")
+        nodes = sum(result[3] for result in results)
+        elapsed = sum(result[4] for result in results)
+        summary.append((name, nodes, elapsed))
+        print(f"   total {nodes} nodes in {elapsed:.2f}s ({int(nodes / elapsed) if elapsed else 0} nps)")
+
+    if len(summary) > 1:
+        print("== summary")
+        for name, nodes, elapsed in summary:
+            print(f"{name:20} {nodes:>10} nodes {elapsed:8.2f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
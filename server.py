@@ -0,0 +1,302 @@
+# multi-game server: many ChessBoard sessions over one asyncio event loop,
+# bot searches run in a bounded process pool
+#
+#   python server.py --port 8765 --workers 4
+#   python server.py --unix /tmp/chess.sock
+#
+# the protocol is one JSON object per line each way. every request has an
+# "op" and may carry an "id" that is copied into the response; responses have
+# "ok": true or "ok": false with an "error"
+#
+#   {"op": "new", "fen": "...", "depth": 4}        -> {"game": 1, "fen": ..., "status": "ongoing"}
+#   {"op": "move", "game": 1, "move": "e2e4", "reply": true, "move_time": 0.5}
+#                                                 -> {"fen": ..., "status": ..., "bot_move": "e7e5"}
+#   {"op": "bot", "game": 1, "move_time": 0.5}    -> {"bot_move": ..., "fen": ..., "status": ...}
+#   {"op": "state", "game": 1}                    -> position, status and search latency of the game
+#   {"op": "close", "game": 1}
+#   {"op": "stats"}                               -> open games, queue depth and latency figures
+#
+# a bot search always runs on the clock: "move_time" (seconds, null for the
+# default) is its budget and "depth" (the game's, or the request's) caps how
+# deep it goes within it.
+#
+# a bot move is only queued while fewer than --max-queue searches are
+# waiting or running, otherwise the request fails with "server busy". each
+# connection handles its requests in order, so a client that sends faster
+# than it is served is slowed down by TCP flow control
+import argparse
+import asyncio
+import json
+import sys
+import time
+import traceback
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from main2 import ChessBoard, ImprovedChessBot, STARTING_FEN, parse_uci_move
+from uci import uci_move
+
+DEFAULT_MOVE_TIME = 1.0
+MAX_MOVE_TIME = 30.0
+DEFAULT_DEPTH = 4
+MAX_DEPTH = 8
+# recent search latencies kept for the percentiles in "stats"
+LATENCY_WINDOW = 1000
+
+
+class RequestError(Exception):
+    pass
+
+
+# a field of the request, default when missing or null; anything but a
+# number of the given type is a RequestError
+def number_field(request, name, default, kind=(int, float)):
+    value = request.get(name)
+    if value is None:
+        return default
+    if isinstance(value, bool) or not isinstance(value, kind):
+        raise RequestError(f"{name} must be {'an integer' if kind is int else 'a number'}")
+    return value
+
+
+def depth_field(request, default):
+    depth = number_field(request, 'depth', default, int)
+    if depth < 1:
+        raise RequestError("depth must be at least 1")
+    return min(depth, MAX_DEPTH)
+
+
+def move_time_field(request):
+    move_time = number_field(request, 'move_time', DEFAULT_MOVE_TIME)
+    if not move_time > 0: # also refuses NaN
+        raise RequestError("move_time must be positive")
+    return min(max(move_time, 0.01), MAX_MOVE_TIME)
+
+
+# runs in a worker process. returns the move in coordinate notation (None if
+# there is no legal move), its score and the nodes searched
+def search_position(fen, depth, move_time):
+    board = ChessBoard.from_fen(fen)
+    bot = ImprovedChessBot(board.turn, depth, move_time=move_time)
+    move = bot.choose_move(board, depth_limit=depth)
+    if move is None:
+        return None, None, 0
+    return uci_move(board, move), bot.best_score, bot.context.nodes
+
+
+def game_status(board):
+    if board.has_legal_move(board.turn):
+        return 'ongoing'
+    return 'checkmate' if board.is_in_check(board.turn) else 'stalemate'
+
+
+class Game:
+    def __init__(self, board, depth):
+        self.board = board
+        self.depth = depth
+        self.lock = asyncio.Lock() # one move or search at a time
+        self.searches = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    def record(self, latency):
+        self.searches += 1
+        self.total_latency += latency
+        self.max_latency = max(self.max_latency, latency)
+
+    def state(self):
+        return {
+            'fen': self.board.to_fen(),
+            'turn': self.board.turn,
+            'status': game_status(self.board),
+            'searches': self.searches,
+            'mean_latency': round(self.total_latency / self.searches, 4) if self.searches else None,
+            'max_latency': round(self.max_latency, 4),
+        }
+
+
+class GameServer:
+    def __init__(self, workers=None, max_queue=64, max_games=1000):
+        self.pool = ProcessPoolExecutor(workers)
+        self.max_queue = max_queue
+        self.max_games = max_games
+        self.games = {}
+        self.next_game = 1
+        self.queue_depth = 0 # searches submitted and not finished
+        self.searches = 0
+        self.rejected = 0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                response = await self.respond(line)
+                writer.write(json.dumps(response).encode() + b'\n')
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def respond(self, line):
+        request_id = None
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise RequestError("request must be a JSON object")
+            request_id = request.get('id')
+            response = await self.dispatch(request)
+            response['ok'] = True
+        except (RequestError, ValueError) as error:
+            response = {'ok': False, 'error': str(error)}
+        except Exception as error:
+            # a bug: logged, and only this request fails while the connection stays up
+            traceback.print_exc(file=sys.stderr)
+            response = {'ok': False, 'error': f"internal error: {type(error).__name__}: {error}"}
+        if request_id is not None:
+            response['id'] = request_id
+        return response
+
+    async def dispatch(self, request):
+        op = request.get('op')
+        if op == 'new':
+            return self.new_game(request)
+        if op == 'stats':
+            return self.stats()
+
+        game_id = request.get('game')
+        game = self.games.get(game_id) if isinstance(game_id, int) else None
+        if game is None:
+            raise RequestError(f"unknown game: {game_id!r}")
+        if op == 'move':
+            return await self.play_move(game, request)
+        if op == 'bot':
+            async with game.lock:
+                return await self.bot_move(game, move_time_field(request), depth_field(request, game.depth))
+        if op == 'state':
+            return game.state()
+        if op == 'close':
+            del self.games[game_id]
+            return {'game': game_id}
+        raise RequestError(f"unknown op: {op!r}")
+
+    def new_game(self, request):
+        if len(self.games) >= self.max_games:
+            raise RequestError("too many open games")
+        fen = request.get('fen', STARTING_FEN)
+        if not isinstance(fen, str):
+            raise RequestError("fen must be a string")
+        board = ChessBoard.from_fen(fen)
+        depth = depth_field(request, DEFAULT_DEPTH)
+        # everything that can fail happens before the game is registered
+        status = game_status(board)
+        game_id = self.next_game
+        self.next_game += 1
+        self.games[game_id] = Game(board, depth)
+        return {'game': game_id, 'fen': board.to_fen(), 'status': status}
+
+    async def play_move(self, game, request):
+        async with game.lock:
+            board = game.board
+            if game_status(board) != 'ongoing':
+                raise RequestError("the game is over")
+            move = parse_uci_move(board, str(request.get('move', '')))
+            # checked before playing the move, so a refused reply doesn't half-apply the request
+            if request.get('reply'):
+                move_time = move_time_field(request)
+                depth = depth_field(request, game.depth)
+                if self.queue_depth >= self.max_queue:
+                    self.rejected += 1
+                    raise RequestError("server busy")
+            board.make_move(*move)
+            if request.get('reply') and game_status(board) == 'ongoing':
+                return await self.bot_move(game, move_time, depth)
+            return {'fen': board.to_fen(), 'status': game_status(board)}
+
+    # the caller holds the game lock and has checked move_time and depth
+    async def bot_move(self, game, move_time, depth):
+        board = game.board
+        if game_status(board) != 'ongoing':
+            raise RequestError("the game is over")
+        if self.queue_depth >= self.max_queue:
+            self.rejected += 1
+            raise RequestError("server busy")
+
+        self.queue_depth += 1
+        start = time.perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            text, score, nodes = await loop.run_in_executor(self.pool, search_position, board.to_fen(), depth, move_time)
+        finally:
+            self.queue_depth -= 1
+        latency = time.perf_counter() - start
+        game.record(latency)
+        self.searches += 1
+        self.latencies.append(latency)
+
+        if text is not None:
+            board.make_move(*parse_uci_move(board, text))
+        return {'bot_move': text, 'score': score, 'nodes': nodes, 'latency': round(latency, 4),
+                'fen': board.to_fen(), 'status': game_status(board)}
+
+    def stats(self):
+        latencies = sorted(self.latencies)
+        percentile = lambda p: round(latencies[min(len(latencies) - 1, int(p * len(latencies)))], 4) if latencies else None
+        return {
+            'games': len(self.games),
+            'queue_depth': self.queue_depth,
+            'max_queue': self.max_queue,
+            'searches': self.searches,
+            'rejected': self.rejected,
+            'latency_p50': percentile(0.5),
+            'latency_p95': percentile(0.95),
+            'latency_max': round(latencies[-1], 4) if latencies else None,
+        }
+
+    async def report(self, interval):
+        while True:
+            await asyncio.sleep(interval)
+            print(json.dumps(self.stats()), file=sys.stderr, flush=True)
+
+    def close(self):
+        self.pool.shutdown(cancel_futures=True)
+
+
+async def serve(args):
+    server = GameServer(args.workers, args.max_queue, args.max_games)
+    if args.unix:
+        listener = await asyncio.start_unix_server(server.handle_connection, path=args.unix)
+    else:
+        listener = await asyncio.start_server(server.handle_connection, args.host, args.port)
+    if args.report:
+        asyncio.get_running_loop().create_task(server.report(args.report))
+    print(f"listening on {args.unix or f'{args.host}:{args.port}'}", file=sys.stderr, flush=True)
+    try:
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        server.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve many concurrent games over line-delimited JSON")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--unix", help="listen on a Unix socket at this path instead of TCP")
+    parser.add_argument("--workers", type=int, default=None, help="search processes (default: CPU count)")
+    parser.add_argument("--max-queue", type=int, default=64, help="searches queued or running before new ones are refused")
+    parser.add_argument("--max-games", type=int, default=1000)
+    parser.add_argument("--report", type=float, default=0, help="print stats to stderr every this many seconds")
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
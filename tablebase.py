@@ -0,0 +1,527 @@
+# endgame tablebases: distance to mate for every position of a small
+# material set (up to 4 pieces), built by retrograde analysis and probed by
+# the search through memory-mapped files
+#
+#   python tablebase.py generate KQvK KRvK KPvK --dir tables
+#   python tablebase.py probe --fen "8/8/8/4k3/8/8/8/KQ6 w - - 0 1" --dir tables
+#
+# a table is named by its material, strong side first ("KQvK", "KBNvK"), and
+# holds one byte per position and side to move: 0 for a draw, otherwise
+# plies to mate + 1 with an odd distance a win and an even one a loss for the
+# side to move. positions are indexed with the white king moved into the
+# a1-d1-d4 triangle (a-d files for tables with pawns), so a 4 piece pawnless
+# table takes 2 * 10 * 64^3 bytes. castling is never possible in a table and
+# en passant is ignored, captures and promotions lead into the smaller tables
+# which are generated first. generating 4 piece tables takes a long time
+import argparse
+import mmap
+import os
+import sys
+from array import array
+
+from bitboard import (KNIGHT_ATTACKS, KING_ATTACKS, PAWN_ATTACKS, WHITE, BLACK,
+                      rook_attacks, bishop_attacks, queen_attacks, squares_of)
+from main2 import ChessBoard, MATE_SCORE, Pawn, Knight, Bishop, Rook, Queen, King, STARTING_FEN
+
+MAX_PIECES = 4
+# longest distance a table byte can hold
+MAX_DISTANCE = 254
+# a tablebase win scores below any mate the search finds itself, shorter
+# mates score higher
+TABLEBASE_WIN = MATE_SCORE // 2
+
+LETTER_ORDER = 'KQRBNP'
+LETTER_VALUES = {'K': 0, 'Q': 9, 'R': 5, 'B': 3, 'N': 3, 'P': 1}
+PIECE_LETTERS = {King: 'K', Queen: 'Q', Rook: 'R', Bishop: 'B', Knight: 'N', Pawn: 'P'}
+EXTENSION = '.tbd'
+
+
+def _square_transforms():
+    transforms = []
+    for mapping in [lambda r, c: (r, c), lambda r, c: (r, 7 - c), lambda r, c: (7 - r, c),
+                    lambda r, c: (7 - r, 7 - c), lambda r, c: (c, r), lambda r, c: (c, 7 - r),
+                    lambda r, c: (7 - c, r), lambda r, c: (7 - c, 7 - r)]:
+        table = []
+        for square in range(64):
+            row, col = mapping(*divmod(square, 8))
+            table.append(row * 8 + col)
+        transforms.append(table)
+    return transforms
+
+
+# the 8 symmetries of the board; tables with pawns only use the first two
+# (identity and the mirror across the d/e files)
+SQUARE_TRANSFORMS = _square_transforms()
+TRIANGLE = [square for square in range(64) if square // 8 <= square % 8 <= 3]
+QUEENSIDE = [square for square in range(64) if square % 8 <= 3]
+
+
+def _sorted_letters(letters):
+    return ''.join(sorted(letters, key=LETTER_ORDER.index))
+
+
+# 'KQvK' -> ('KQ', 'K')
+def parse_signature(signature):
+    sides = signature.upper().split('V')
+    if len(sides) != 2 or not all(side and side[0] == 'K' for side in sides):
+        raise ValueError(f"invalid material signature: {signature!r}")
+    white, black = (_sorted_letters(side) for side in sides)
+    if any(letter not in LETTER_ORDER for letter in white + black) or 'K' in white[1:] + black[1:]:
+        raise ValueError(f"invalid material signature: {signature!r}")
+    if len(white) + len(black) > MAX_PIECES:
+        raise ValueError(f"at most {MAX_PIECES} pieces: {signature!r}")
+    return white, black
+
+
+# the table name of a material balance, and whether the colors have to be
+# swapped to look it up
+def canonical_signature(white, black):
+    white, black = _sorted_letters(white), _sorted_letters(black)
+    strength = lambda letters: (sum(LETTER_VALUES[letter] for letter in letters), [-LETTER_ORDER.index(letter) for letter in letters])
+    if strength(black) > strength(white):
+        return f"{black}v{white}", True
+    return f"{white}v{black}", False
+
+
+# no side can be mated: a bare king against at most one minor piece. with a
+# minor piece each (KBvKB, KNvKN, KBvKN) a king can be mated in the corner
+# behind its own piece, those have tables like any other ending
+def drawn_material(white, black):
+    return 'K' in (white, black) and white in ('K', 'KB', 'KN') and black in ('K', 'KB', 'KN')
+
+
+def _piece_attacks(letter, color, square, occupied):
+    if letter == 'K':
+        return KING_ATTACKS[square]
+    if letter == 'N':
+        return KNIGHT_ATTACKS[square]
+    if letter == 'B':
+        return bishop_attacks(square, occupied)
+    if letter == 'R':
+        return rook_attacks(square, occupied)
+    if letter == 'Q':
+        return queen_attacks(square, occupied)
+    return PAWN_ATTACKS[WHITE if color == 'white' else BLACK][square]
+
+
+# positions inside the generator are lists of (letter, color, square)
+def _in_check(pieces, color):
+    occupied = 0
+    king = None
+    for letter, piece_color, square in pieces:
+        occupied |= 1 << square
+        if letter == 'K' and piece_color == color:
+            king = square
+    bit = 1 << king
+    for letter, piece_color, square in pieces:
+        if piece_color != color and _piece_attacks(letter, piece_color, square, occupied) & bit:
+            return True
+    return False
+
+
+# pseudo-legal moves of color as (pieces after the move, True if a capture
+# or promotion changed the material)
+def _moves(pieces, color):
+    occupied = own = 0
+    for _, piece_color, square in pieces:
+        occupied |= 1 << square
+        if piece_color == color:
+            own |= 1 << square
+    white = color == 'white'
+    for i, (letter, piece_color, square) in enumerate(pieces):
+        if piece_color != color:
+            continue
+        if letter == 'P':
+            targets = PAWN_ATTACKS[WHITE if white else BLACK][square] & occupied & ~own
+            one = square + (8 if white else -8)
+            if not occupied >> one & 1:
+                targets |= 1 << one
+                two = one + (8 if white else -8)
+                if square // 8 == (1 if white else 6) and not occupied >> two & 1:
+                    targets |= 1 << two
+        else:
+            targets = _piece_attacks(letter, color, square, occupied) & ~own
+
+        for target in squares_of(targets):
+            if occupied >> target & 1 or (letter == 'P' and target // 8 in (0, 7)):
+                rest = [piece for j, piece in enumerate(pieces) if j != i and piece[2] != target]
+                if letter == 'P' and target // 8 in (0, 7):
+                    for promoted in 'QRBN':
+                        yield rest + [(promoted, color, target)], True
+                else:
+                    yield rest + [(letter, color, target)], True
+            else:
+                moved = list(pieces)
+                moved[i] = (letter, color, target)
+                yield moved, False
+
+
+# positions with color to move that reach pieces by a quiet move of color
+# (no capture or promotion); only legal ones are returned
+def _unmoves(pieces, color):
+    occupied = 0
+    for _, _, square in pieces:
+        occupied |= 1 << square
+    white = color == 'white'
+    opponent = 'black' if white else 'white'
+    for i, (letter, piece_color, square) in enumerate(pieces):
+        if piece_color != color:
+            continue
+        if letter == 'P':
+            origins = 0
+            row = square // 8
+            one = square - 8 if white else square + 8
+            if (row >= 2 if white else row <= 5) and not occupied >> one & 1:
+                origins |= 1 << one
+                two = one - 8 if white else one + 8
+                if row == (3 if white else 4) and not occupied >> two & 1:
+                    origins |= 1 << two
+        else:
+            origins = _piece_attacks(letter, color, square, occupied) & ~occupied
+
+        for origin in squares_of(origins):
+            moved = list(pieces)
+            moved[i] = (letter, color, origin)
+            if not _in_check(moved, opponent):
+                yield moved
+
+
+# maps positions of one material set to table indices
+class TableLayout:
+    def __init__(self, white, black):
+        self.white = white
+        self.black = black
+        self.signature = f"{white}v{black}"
+        # kings first, then the other pieces of each side with equal pieces next to each other
+        self.pieces = ([('K', 'white'), ('K', 'black')] + [(letter, 'white') for letter in white[1:]]
+                       + [(letter, 'black') for letter in black[1:]])
+        self.has_pawns = 'P' in white + black
+        region = QUEENSIDE if self.has_pawns else TRIANGLE
+        transforms = SQUARE_TRANSFORMS[:2] if self.has_pawns else SQUARE_TRANSFORMS
+        self.region = region
+        self.region_index = {square: i for i, square in enumerate(region)}
+        # symmetries that move a white king on each square into the region
+        self.king_transforms = [[t for t in transforms if t[square] in self.region_index] for square in range(64)]
+        self.groups = []
+        start = 2
+        while start < len(self.pieces):
+            end = start
+            while end < len(self.pieces) and self.pieces[end] == self.pieces[start]:
+                end += 1
+            if end - start > 1:
+                self.groups.append((start, end))
+            start = end
+        self.others = len(self.pieces) - 1
+        self.size = len(region) * 64 ** self.others
+
+    # index of a position given as the squares of self.pieces in order
+    def index(self, squares):
+        best = None
+        for transform in self.king_transforms[squares[0]]:
+            moved = [transform[square] for square in squares]
+            for start, end in self.groups:
+                moved[start:end] = sorted(moved[start:end])
+            if best is None or moved < best:
+                best = moved
+        index = self.region_index[best[0]]
+        for square in best[1:]:
+            index = index * 64 + square
+        return index
+
+    def squares(self, index):
+        rest = []
+        for _ in range(self.others):
+            index, square = divmod(index, 64)
+            rest.append(square)
+        return [self.region[index]] + rest[::-1]
+
+    # squares of (letter, color, square) pieces in the order of self.pieces
+    def squares_of_pieces(self, pieces):
+        by_piece = {}
+        for letter, color, square in pieces:
+            by_piece.setdefault((letter, color), []).append(square)
+        return [by_piece[piece].pop() for piece in self.pieces]
+
+    # true if the squares are a possible placement stored under this index
+    def is_canonical(self, index, squares):
+        if len(set(squares)) != len(squares):
+            return False
+        for (letter, _), square in zip(self.pieces, squares):
+            if letter == 'P' and square // 8 in (0, 7):
+                return False
+        return self.index(squares) == index
+
+
+class Tablebase:
+    # directory holds the .tbd files; tables are mapped the first time they're needed
+    def __init__(self, directory):
+        self.directory = directory
+        self.tables = {} # signature -> (layout, mapped data), or None if there's no file
+        self.hits = 0
+
+    def path(self, signature):
+        return os.path.join(self.directory, signature + EXTENSION)
+
+    def table(self, signature):
+        if signature not in self.tables:
+            path = self.path(signature)
+            if os.path.exists(path):
+                layout = TableLayout(*parse_signature(signature))
+                with open(path, 'rb') as f:
+                    data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                if len(data) != 2 * layout.size:
+                    raise ValueError(f"{path}: expected {2 * layout.size} bytes, found {len(data)}")
+                self.tables[signature] = (layout, data)
+            else:
+                self.tables[signature] = None
+        return self.tables[signature]
+
+    # table byte of a position given as (letter, color, square) pieces, or
+    # None if its table isn't available
+    def lookup(self, pieces, white_to_move):
+        white = _sorted_letters(letter for letter, color, _ in pieces if color == 'white')
+        black = _sorted_letters(letter for letter, color, _ in pieces if color == 'black')
+        if drawn_material(white, black):
+            return 0
+        signature, flipped = canonical_signature(white, black)
+        table = self.table(signature)
+        if table is None:
+            return None
+        layout, data = table
+        if flipped:
+            # mirror the ranks and swap the colors
+            pieces = [(letter, 'black' if color == 'white' else 'white', square ^ 56) for letter, color, square in pieces]
+            white_to_move = not white_to_move
+        index = layout.index(layout.squares_of_pieces(pieces))
+        return data[index if white_to_move else layout.size + index]
+
+    # (result, plies) for the side to move: result 1 win, 0 draw, -1 loss,
+    # plies to mate. None if the position isn't covered
+    def probe(self, board):
+        if board.castling_rights or sum(board.piece_counts) > MAX_PIECES:
+            return None
+        pieces = []
+        for row in range(8):
+            for col in range(8):
+                piece = board.board[row][col]
+                if piece:
+                    pieces.append((PIECE_LETTERS[type(piece)], piece.color, row * 8 + col))
+        # en passant isn't in the tables, only matters with pawns on both sides
+        if board.en_passant_target and board.piece_counts[Pawn('white').code] and board.piece_counts[Pawn('black').code]:
+            return None
+        value = self.lookup(pieces, board.turn == 'white')
+        if value is None:
+            return None
+        if value == 0:
+            return 0, 0
+        plies = value - 1
+        return (1 if plies % 2 else -1), plies
+
+    # search score from white's point of view, or None
+    def score(self, board):
+        result = self.probe(board)
+        if result is None:
+            return None
+        self.hits += 1
+        outcome, plies = result
+        if outcome == 0:
+            return 0
+        score = TABLEBASE_WIN - plies if outcome > 0 else plies - TABLEBASE_WIN
+        return score if board.turn == 'white' else -score
+
+
+# tables a capture or promotion in this one leads into
+def subtables(white, black):
+    materials = set()
+    for side in (0, 1):
+        letters = [white, black]
+        own = letters[side]
+        for i, letter in enumerate(own):
+            if letter == 'K':
+                continue
+            removed = own[:i] + own[i + 1:]
+            materials.add(tuple(removed if s == side else letters[s] for s in (0, 1)))
+            if letter == 'P':
+                for promoted in 'QRBN':
+                    materials.add(tuple(removed + promoted if s == side else letters[s] for s in (0, 1)))
+    signatures = set()
+    for material in materials:
+        if not drawn_material(*material):
+            signatures.add(canonical_signature(*material)[0])
+    return sorted(signatures)
+
+
+class _Generator:
+    def __init__(self, layout, tablebase):
+        self.layout = layout
+        self.tablebase = tablebase
+        size = layout.size
+        self.final = bytearray(2 * size)
+        self.tentative = bytearray(2 * size) # plies of a win found but not yet settled
+        # positions reached by quiet moves that aren't known to lose yet. they're
+        # counted after symmetry, two moves to mirror images are one position
+        self.count = array('h', [0]) * (2 * size)
+        self.buckets = [[] for _ in range(MAX_DISTANCE + 1)]
+
+    def pieces(self, position):
+        layout = self.layout
+        side, index = divmod(position, layout.size)
+        squares = layout.squares(index)
+        color = 'black' if side else 'white'
+        return [(letter, piece_color, square) for (letter, piece_color), square in zip(layout.pieces, squares)], color
+
+    def position(self, pieces, color):
+        return (self.layout.size if color == 'black' else 0) + self.layout.index([square for _, _, square in pieces])
+
+    def push(self, plies, position):
+        if plies > MAX_DISTANCE:
+            raise ValueError(f"{self.layout.signature}: distance {plies} doesn't fit the table format")
+        self.buckets[plies].append(position)
+
+    # plies to being mated if every legal move loses, else None
+    def loss_distance(self, pieces, color):
+        opponent = 'black' if color == 'white' else 'white'
+        worst = -1
+        for moved, converts in _moves(pieces, color):
+            if _in_check(moved, color):
+                continue
+            if converts:
+                value = self.tablebase.lookup(moved, opponent == 'white')
+            else:
+                value = self.final[self.position(moved, opponent)]
+            # a draw, an unsettled position or a loss for the opponent
+            if not value or (value - 1) % 2 == 0:
+                return None
+            worst = max(worst, value - 1)
+        return worst + 1
+
+    # first pass: mates, counts of quiet moves, and results decided by
+    # captures or promotions into smaller tables
+    def initialize(self):
+        layout = self.layout
+        for index in range(layout.size):
+            squares = layout.squares(index)
+            if not layout.is_canonical(index, squares):
+                continue
+            for side, color in enumerate(['white', 'black']):
+                opponent = 'black' if side == 0 else 'white'
+                pieces = [(letter, piece_color, square) for (letter, piece_color), square in zip(layout.pieces, squares)]
+                # the side not to move can't be in check
+                if _in_check(pieces, opponent):
+                    continue
+                position = side * layout.size + index
+                legal = 0
+                quiet = set()
+                draw_exit = False
+                win = 0
+                for moved, converts in _moves(pieces, color):
+                    if _in_check(moved, color):
+                        continue
+                    legal += 1
+                    if not converts:
+                        quiet.add(self.position(moved, opponent))
+                        continue
+                    value = self.tablebase.lookup(moved, opponent == 'white')
+                    if value is None:
+                        raise ValueError(f"{layout.signature}: missing table for {moved}")
+                    if value == 0:
+                        draw_exit = True
+                    elif (value - 1) % 2 == 0 and (not win or value < win):
+                        win = value
+                if not legal:
+                    if _in_check(pieces, color):
+                        self.push(0, position)
+                    continue
+                self.count[position] = len(quiet)
+                if win:
+                    self.tentative[position] = win
+                    self.push(win, position)
+                elif not quiet and not draw_exit:
+                    self.push(self.loss_distance(pieces, color), position)
+
+    # settles positions in order of distance; each settled position passes
+    # its result back to the positions that reach it with a quiet move
+    def run(self):
+        final, tentative, count = self.final, self.tentative, self.count
+        for plies in range(MAX_DISTANCE + 1):
+            for position in self.buckets[plies]:
+                if final[position] or (plies % 2 and tentative[position] != plies):
+                    continue
+                final[position] = plies + 1
+                pieces, color = self.pieces(position)
+                mover = 'black' if color == 'white' else 'white'
+                seen = set()
+                for previous in _unmoves(pieces, mover):
+                    before = self.position(previous, mover)
+                    if final[before] or before in seen:
+                        continue
+                    seen.add(before)
+                    if plies % 2 == 0:
+                        # a move to a lost position wins
+                        if not tentative[before] or tentative[before] > plies + 1:
+                            tentative[before] = plies + 1
+                            self.push(plies + 1, before)
+                    else:
+                        count[before] -= 1
+                        if count[before] == 0 and not tentative[before]:
+                            distance = self.loss_distance(previous, mover)
+                            if distance is not None:
+                                self.push(distance, before)
+            self.buckets[plies] = None
+        return bytes(final)
+
+
+# builds a table (and the smaller ones it depends on) into directory;
+# existing files are kept. returns the path of the table
+def generate(signature, directory, verbose=False):
+    white, black = parse_signature(signature)
+    canonical, flipped = canonical_signature(white, black)
+    if flipped or drawn_material(white, black):
+        raise ValueError(f"{signature!r}: generate {canonical!r} instead" if flipped else f"{signature!r} is a draw")
+    tablebase = Tablebase(directory)
+    path = tablebase.path(canonical)
+    if os.path.exists(path):
+        return path
+
+    for subtable in subtables(white, black):
+        generate(subtable, directory, verbose)
+    os.makedirs(directory, exist_ok=True)
+    if verbose:
+        print(f"generating {canonical}")
+    generator = _Generator(TableLayout(white, black), tablebase)
+    generator.initialize()
+    data = generator.run()
+    temporary = path + '.tmp'
+    with open(temporary, 'wb') as f:
+        f.write(data)
+    os.replace(temporary, path)
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate and probe endgame tablebases")
+    commands = parser.add_subparsers(dest='command', required=True)
+    build = commands.add_parser('generate', help="generate tables (and the ones they depend on)")
+    build.add_argument('signatures', nargs='+', help="material, e.g. KQvK KRvK KPvK KBNvK")
+    build.add_argument('--dir', default='tables')
+    probe = commands.add_parser('probe', help="look up a position")
+    probe.add_argument('--fen', default=STARTING_FEN)
+    probe.add_argument('--dir', default='tables')
+    args = parser.parse_args(argv)
+
+    if args.command == 'generate':
+        for signature in args.signatures:
+            print(generate(signature, args.dir, verbose=True))
+        return 0
+
+    result = Tablebase(args.dir).probe(ChessBoard.from_fen(args.fen))
+    if result is None:
+        print("not in the tablebase")
+        return 1
+    outcome, plies = result
+    print({1: f"win in {plies} plies", 0: "draw", -1: f"loss in {plies} plies"}[outcome])
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
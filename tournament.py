@@ -0,0 +1,197 @@
+# self-play tournament: two bots play a series of games from a list of
+# opening positions, each opening once with either color. games run in
+# parallel worker processes and are written to the PGN file as they finish,
+# with a running score and Elo estimate
+#
+#   python tournament.py --games 200 --workers 8 --pgn games.pgn
+#   python tournament.py --player-a "improved:depth=3" --player-b "improved:depth=3,lmr=false"
+#   python tournament.py --player-a "improved:move_time=0.1" --player-b "basic:depth=2" --openings fens.txt
+#
+# a player is "basic" (ChessBot) or "improved" (ImprovedChessBot) followed by
+# constructor arguments. games end on checkmate, stalemate, threefold
+# repetition or the ply limit (a draw)
+import argparse
+import math
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from main2 import ChessBoard, ChessBot, ImprovedChessBot
+from pgn import game_to_pgn, move_to_san
+
+PLAYER_CLASSES = {'basic': ChessBot, 'improved': ImprovedChessBot}
+DEFAULT_DEPTHS = {'basic': 2, 'improved': 3}
+
+# balanced positions a few moves into common openings
+OPENINGS = [
+    "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+    "r1bqkbnr/pppp1ppp/2n5/4p3/4P3/5N2/PPPP1PPP/RNBQKB1R w KQkq - 2 3",
+    "rnbqkbnr/pp1ppppp/8/2p5/4P3/8/PPPP1PPP/RNBQKBNR w KQkq - 0 2",
+    "rnbqkbnr/pppp1ppp/4p3/8/3PP3/8/PPP2PPP/RNBQKBNR b KQkq - 0 2",
+    "rnbqkb1r/pppppppp/5n2/8/2PP4/8/PP2PPPP/RNBQKBNR b KQkq - 0 2",
+    "rnbqkbnr/ppp1pppp/8/3p4/2PP4/8/PP2PPPP/RNBQKBNR b KQkq - 0 2",
+    "rnbqkbnr/pp1ppppp/2p5/8/4P3/8/PPPP1PPP/RNBQKBNR w KQkq - 0 2",
+    "r1bqkb1r/pppp1ppp/2n2n2/4p3/2B1P3/5N2/PPPP1PPP/RNBQK2R w KQkq - 4 4",
+]
+MAX_PLIES = 200
+
+
+# "improved:depth=3,move_time=0.1,lmr=false" -> ('improved', {...})
+def parse_player(spec):
+    kind, _, arguments = spec.partition(':')
+    if kind not in PLAYER_CLASSES:
+        raise ValueError(f"unknown player type: {kind!r}")
+    options = {'depth': DEFAULT_DEPTHS[kind]}
+    for item in filter(None, arguments.split(',')):
+        name, separator, value = item.partition('=')
+        if not separator:
+            raise ValueError(f"invalid player option: {item!r}")
+        if value.lower() in ('true', 'false'):
+            options[name] = value.lower() == 'true'
+        else:
+            try:
+                options[name] = int(value)
+            except ValueError:
+                options[name] = float(value)
+    return kind, options
+
+
+def make_bot(spec, color):
+    kind, options = parse_player(spec)
+    return PLAYER_CLASSES[kind](color, **options)
+
+
+# plays one game in a worker process; returns (result, termination, SAN moves)
+def play_game(white_spec, black_spec, fen, max_plies):
+    board = ChessBoard.from_fen(fen)
+    bots = {'white': make_bot(white_spec, 'white'), 'black': make_bot(black_spec, 'black')}
+    seen = {board.hash: 1}
+    sans = []
+    while True:
+        color = board.turn
+        if not board.has_legal_move(color):
+            if board.is_in_check(color):
+                return ('0-1' if color == 'white' else '1-0'), 'checkmate', sans
+            return '1/2-1/2', 'stalemate', sans
+        if len(sans) >= max_plies:
+            return '1/2-1/2', 'move limit', sans
+
+        move = bots[color].choose_move(board)
+        sans.append(move_to_san(board, move))
+        board.make_move(*move)
+        seen[board.hash] = seen.get(board.hash, 0) + 1
+        if seen[board.hash] >= 3:
+            return '1/2-1/2', 'repetition', sans
+
+
+# Elo difference of a score fraction
+def elo(score):
+    if score <= 0:
+        return -math.inf
+    if score >= 1:
+        return math.inf
+    return 400 * math.log10(score / (1 - score))
+
+
+# Elo difference of player a and its 95% confidence interval from wins,
+# draws and losses
+def elo_estimate(wins, draws, losses):
+    games = wins + draws + losses
+    if not games:
+        return 0.0, -math.inf, math.inf
+    score = (wins + draws / 2) / games
+    variance = (wins * (1 - score) ** 2 + draws * (0.5 - score) ** 2 + losses * score ** 2) / games
+    margin = 1.96 * math.sqrt(variance / games)
+    return elo(score), elo(score - margin), elo(score + margin)
+
+
+class Standings:
+    def __init__(self):
+        self.wins = self.draws = self.losses = 0 # from player a's side
+        self.terminations = {}
+
+    def add(self, result, a_white, termination):
+        if result == '1/2-1/2':
+            self.draws += 1
+        elif (result == '1-0') == a_white:
+            self.wins += 1
+        else:
+            self.losses += 1
+        self.terminations[termination] = self.terminations.get(termination, 0) + 1
+
+    def summary(self):
+        games = self.wins + self.draws + self.losses
+        difference, low, high = elo_estimate(self.wins, self.draws, self.losses)
+        points = self.wins + self.draws / 2
+        return (f"{games} games: +{self.wins} ={self.draws} -{self.losses} ({points:g}/{games}), "
+                f"elo {difference:+.0f} [{low:+.0f}, {high:+.0f}]")
+
+
+def read_openings(path):
+    with open(path) as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith('#')]
+
+
+def run(player_a, player_b, games, workers, pgn_path, openings=OPENINGS, max_plies=MAX_PLIES, output=sys.stdout):
+    # game i uses opening i // 2, player a takes white in the even games
+    tasks = []
+    for i in range(games):
+        fen = openings[(i // 2) % len(openings)]
+        a_white = i % 2 == 0
+        tasks.append((i + 1, fen, a_white))
+
+    standings = Standings()
+    with ProcessPoolExecutor(workers) as pool, open(pgn_path, 'w') as pgn:
+        pending = {}
+        queued = iter(tasks)
+        # only a few games are queued ahead, finished ones are written and dropped
+        window = 2 * (workers or os.cpu_count() or 1)
+
+        def submit():
+            for number, fen, a_white in queued:
+                white, black = (player_a, player_b) if a_white else (player_b, player_a)
+                pending[pool.submit(play_game, white, black, fen, max_plies)] = (number, fen, a_white, white, black)
+                if len(pending) >= window:
+                    break
+
+        submit()
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                number, fen, a_white, white, black = pending.pop(future)
+                result, termination, sans = future.result()
+                standings.add(result, a_white, termination)
+                pgn.write(game_to_pgn(white, black, result, sans, fen, event='Tournament', round_number=number,
+                                      headers={'Termination': termination}) + '\n')
+                pgn.flush()
+                print(f"game {number}: {white} vs {black} {result} ({termination}) | {standings.summary()}", file=output, flush=True)
+            submit()
+
+    terminations = ', '.join(f"{name} {count}" for name, count in sorted(standings.terminations.items()))
+    print(f"final: {player_a} vs {player_b}: {standings.summary()}; {terminations}", file=output)
+    return standings
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Play a self-play match between two bot configurations")
+    parser.add_argument("--player-a", default="improved")
+    parser.add_argument("--player-b", default="basic")
+    parser.add_argument("--games", type=int, default=16)
+    parser.add_argument("--workers", type=int, default=None, help="game processes (default: CPU count)")
+    parser.add_argument("--pgn", default="tournament.pgn")
+    parser.add_argument("--openings", help="file with one FEN per line (default: built-in list)")
+    parser.add_argument("--max-plies", type=int, default=MAX_PLIES)
+    args = parser.parse_args(argv)
+
+    try:
+        parse_player(args.player_a)
+        parse_player(args.player_b)
+    except ValueError as error:
+        parser.error(str(error))
+    openings = read_openings(args.openings) if args.openings else OPENINGS
+    run(args.player_a, args.player_b, args.games, args.workers, args.pgn, openings, args.max_plies)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,268 @@
+# UCI front end for ImprovedChessBot, for chess GUIs and match runners
+#
+#   python uci.py
+#
+# commands are read from stdin while the search runs on a worker thread, so
+# "stop" (and "ponderhit") take effect within a few milliseconds. supported:
+# uci, isready, ucinewgame, position [startpos | fen <fen>] [moves ...],
+# go [depth | movetime | wtime btime winc binc movestogo | infinite | ponder],
+# stop, ponderhit, setoption name Hash|Threads value <n>, quit. with Threads
+# above 1 the parallel root search is used; its workers share the stop event
+# and report every depth they finish, so it stops and reports like the serial one
+import sys
+import threading
+import time
+
+from main2 import (ChessBoard, ImprovedChessBot, Pawn, MATE_SCORE, MAX_SEARCH_DEPTH, STARTING_FEN,
+                   move_to_uci, parse_uci_move, principal_variation)
+
+ENGINE_NAME = "CS340 Chess"
+ENGINE_AUTHOR = "CS340"
+DEFAULT_HASH_MB = 16
+MAX_HASH_MB = 1024
+MAX_THREADS = 64
+# rough size of a transposition table bucket with both slots in use
+TT_BUCKET_BYTES = 250
+
+
+# UCI writes queen promotions with a 'q', the engine as plain (start, end) moves
+def uci_move(board, move):
+    text = move_to_uci(move)
+    (row, col), (end_row, _) = move[0], move[1]
+    if len(move) == 2 and isinstance(board.board[row][col], Pawn) and end_row in (0, 7):
+        text += 'q'
+    return text
+
+
+# "cp <n>" or "mate <moves>" from the side to move's point of view
+def uci_score(score, board, depth):
+    if board.turn == 'black':
+        score = -score
+    if abs(score) >= MATE_SCORE:
+        # mate scores carry the depth left at the mated node
+        plies = max(1, depth - (abs(score) - MATE_SCORE))
+        moves = (plies + 1) // 2
+        return f"mate {moves if score > 0 else -moves}"
+    return f"cp {score}"
+
+
+class UciEngine:
+    def __init__(self, output=sys.stdout):
+        self.output = output
+        self.output_lock = threading.Lock()
+        self.board = ChessBoard()
+        self.hash_mb = DEFAULT_HASH_MB
+        self.threads = 1
+        self.bot = None # created on the first search and kept for the game
+        self.thread = None
+        self.stop = threading.Event()
+        self.infinite = False # bestmove has to wait for stop
+        self.pondering = False # bestmove has to wait for stop or ponderhit
+        self.ponder_budget = None # seconds a ponder search gets from ponderhit on
+        self.start_time = 0.0
+
+    def send(self, line):
+        with self.output_lock:
+            self.output.write(line + '\n')
+            self.output.flush()
+
+    def new_bot(self):
+        tt_size = max(1024, self.hash_mb * 1024 * 1024 // TT_BUCKET_BYTES)
+        self.bot = ImprovedChessBot(self.board.turn, MAX_SEARCH_DEPTH, tt_size=tt_size, workers=self.threads)
+        self.bot.stop = self.stop
+        self.bot.on_iteration = self.report
+
+    # returns False on quit
+    def handle(self, line):
+        tokens = line.split()
+        if not tokens:
+            return True
+        command, arguments = tokens[0], tokens[1:]
+        if command == 'uci':
+            self.send(f"id name {ENGINE_NAME}")
+            self.send(f"id author {ENGINE_AUTHOR}")
+            self.send(f"option name Hash type spin default {DEFAULT_HASH_MB} min 1 max {MAX_HASH_MB}")
+            self.send(f"option name Threads type spin default 1 min 1 max {MAX_THREADS}")
+            self.send("uciok")
+        elif command == 'isready':
+            self.send("readyok")
+        elif command == 'ucinewgame':
+            self.wait()
+            self.close_bot()
+            self.board = ChessBoard()
+        elif command == 'setoption':
+            self.wait()
+            self.set_option(arguments)
+        elif command == 'position':
+            self.wait()
+            self.set_position(arguments)
+        elif command == 'go':
+            self.wait()
+            self.go(arguments)
+        elif command == 'stop':
+            self.stop.set()
+            self.wait()
+        elif command == 'ponderhit':
+            self.ponderhit()
+        elif command == 'quit':
+            self.stop.set()
+            self.wait()
+            self.close_bot()
+            return False
+        return True
+
+    def set_option(self, arguments):
+        if 'name' not in arguments or 'value' not in arguments:
+            return
+        name = ' '.join(arguments[arguments.index('name') + 1:arguments.index('value')]).lower()
+        value = ' '.join(arguments[arguments.index('value') + 1:])
+        try:
+            number = int(value)
+        except ValueError:
+            return
+        if name == 'hash':
+            self.hash_mb = min(max(number, 1), MAX_HASH_MB)
+        elif name == 'threads':
+            self.threads = min(max(number, 1), MAX_THREADS)
+        else:
+            return
+        self.close_bot()
+
+    def set_position(self, arguments):
+        if arguments[:1] == ['startpos']:
+            fen = STARTING_FEN
+            rest = arguments[1:]
+        elif arguments[:1] == ['fen']:
+            end = arguments.index('moves') if 'moves' in arguments else len(arguments)
+            fen = ' '.join(arguments[1:end])
+            rest = arguments[end:]
+        else:
+            return
+        try:
+            board = ChessBoard.from_fen(fen)
+            if rest[:1] == ['moves']:
+                for text in rest[1:]:
+                    board.make_move(*parse_uci_move(board, text))
+        except ValueError as error:
+            self.send(f"info string {error}")
+            return
+        self.board = board
+
+    def go(self, arguments):
+        options = {}
+        flags = set()
+        i = 0
+        while i < len(arguments):
+            token = arguments[i]
+            if token in ('infinite', 'ponder'):
+                flags.add(token)
+                i += 1
+            elif token in ('depth', 'movetime', 'wtime', 'btime', 'winc', 'binc', 'movestogo') and i + 1 < len(arguments):
+                try:
+                    options[token] = int(arguments[i + 1])
+                except ValueError:
+                    pass
+                i += 2
+            else:
+                i += 1
+
+        if self.bot is None:
+            self.new_bot()
+        bot = self.bot
+        bot.color = self.board.turn
+        bot.depth = min(options.get('depth', MAX_SEARCH_DEPTH), MAX_SEARCH_DEPTH)
+        bot.move_time = options['movetime'] / 1000 if 'movetime' in options else None
+        bot.deadline = None
+        white = self.board.turn == 'white'
+        time_left = options.get('wtime' if white else 'btime')
+        increment = options.get('winc' if white else 'binc', 0) / 1000
+        time_left = time_left / 1000 if time_left is not None else None
+        moves_to_go = options.get('movestogo')
+        # depth also caps a timed search
+        depth_limit = options.get('depth')
+
+        self.infinite = 'infinite' in flags
+        self.pondering = 'ponder' in flags
+        self.ponder_budget = bot.time_budget(time_left, increment, moves_to_go)
+        if self.infinite or self.pondering:
+            # searched without limits until stop, or until ponderhit sets the clock
+            bot.move_time = None
+            time_left = None
+
+        self.stop.clear()
+        self.start_time = time.perf_counter()
+        self.thread = threading.Thread(target=self.search, args=(time_left, increment, moves_to_go, depth_limit),
+                                       daemon=True)
+        self.thread.start()
+
+    def search(self, time_left, increment, moves_to_go, depth_limit):
+        bot = self.bot
+        board = self.board
+        move = bot.choose_move(board, time_left, increment, moves_to_go=moves_to_go, depth_limit=depth_limit)
+        # the protocol only allows bestmove after stop in infinite and ponder mode
+        while (self.infinite or self.pondering) and not self.stop.wait(0.005):
+            pass
+
+        if move is None:
+            self.send("bestmove 0000")
+            return
+        line = principal_variation(board, bot.tt, move, 2)
+        text = f"bestmove {uci_move(board, move)}"
+        if len(line) > 1:
+            board.make_move(*move)
+            text += f" ponder {uci_move(board, line[1])}"
+            board.unmake_move()
+        self.send(text)
+
+    # the opponent played the expected move: keep searching, now on the clock.
+    # the deadline goes on the bot, which hands it to the search context even
+    # if that is only created after this (and to the workers of a parallel search)
+    def ponderhit(self):
+        if not self.pondering:
+            return
+        bot = self.bot
+        if self.ponder_budget is not None:
+            bot.deadline = time.perf_counter() + self.ponder_budget
+            context = bot.context
+            if context is not None and bot.workers == 1:
+                context.deadline = bot.deadline
+        self.pondering = False
+
+    # info line for every finished depth of the search
+    def report(self, bot, board, depth, move, score):
+        elapsed = time.perf_counter() - self.start_time
+        nodes = bot.context.nodes
+        nps = int(nodes / elapsed) if elapsed > 0 else 0
+        pv = []
+        for move in principal_variation(board, bot.tt, move, depth):
+            pv.append(uci_move(board, move))
+            board.make_move(*move)
+        for _ in pv:
+            board.unmake_move()
+        self.send(f"info depth {depth} score {uci_score(score, board, depth)} nodes {nodes} nps {nps} "
+                  f"time {int(elapsed * 1000)} pv {' '.join(pv)}")
+
+    def wait(self):
+        if self.thread is not None:
+            if self.infinite or self.pondering:
+                self.stop.set()
+            self.thread.join()
+            self.thread = None
+
+    def close_bot(self):
+        if self.bot is not None:
+            self.bot.close()
+            self.bot = None
+
+
+def main():
+    engine = UciEngine()
+    for line in sys.stdin:
+        if not engine.handle(line):
+            break
+    engine.wait()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())